@@ -60,6 +60,9 @@ class TemperatureDialog:
     
     # manual configuration is currently enabled?
     override = False
+    
+    # daemon supports get_snapshot?
+    snapshot_supported = True
         
     disclaimer_text = _("By enabling software control of the system fan, you can damage " 
                         "or shorten the lifespan of your notebook.\n\n" 
@@ -435,11 +438,31 @@ class TemperatureDialog:
             globals.act_settings.set_sensor_names(names)
         self.update_sensor_names()
         
+    def get_monitor_values(self):
+        """Returns (temperatures, hysteresis temperatures, hysteresis levels, fan state)"""
+        if self.snapshot_supported:
+            # one call on daemons that support snapshots
+            try:
+                temps, level, rpm, hys_temps, hys_levels, decision, timestamp = globals.controller.get_snapshot()
+                return temps, hys_temps, hys_levels, {'level': level, 'rpm': rpm}
+            except dbus.exceptions.DBusException, ex:
+                if ex.get_dbus_name() in ['org.freedesktop.DBus.Error.UnknownMethod',
+                                          'org.freedesktop.DBus.Error.AccessDenied']:
+                    self.snapshot_supported = False
+                else:
+                    raise
+        temps = globals.controller.get_temperatures()
+        hys_temps, hys_levels = globals.controller.get_trip_temperatures(), globals.controller.get_trip_fan_speeds()
+        try:
+            fan_state = globals.controller.get_fan_state()
+        except dbus.exceptions.DBusException:
+            fan_state = None
+        return temps, hys_temps, hys_levels, fan_state
+        
     def refresh_monitor(self):
         """Refreshes the temperature/fan monitor"""
         # temperatures
-        temps = globals.controller.get_temperatures()
-        hys_temps, hys_levels = globals.controller.get_trip_temperatures(), globals.controller.get_trip_fan_speeds()
+        temps, hys_temps, hys_levels, fan_state = self.get_monitor_values()
         for n in range(0, len(temps)):
             if abs(temps[n]) in [-128, 128, 0]:
                 self.thermos[n].hide()
@@ -453,7 +476,6 @@ class TemperatureDialog:
 
         # fan speed
         try:
-            fan_state = globals.controller.get_fan_state()
             rpm = fan_state['rpm']
             try:
                 level = " (" + self.thermos[0].trigger_names[fan_state['level']] + ")"
@@ -0,0 +1,271 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, time, gc, json, subprocess, __builtin__
+
+from tpfand import build, control, simulation, vectorized
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# file system calls that are counted while a tick runs
+COUNTED_CALLS = ['open', 'read', 'write', 'lseek', 'close', 'stat']
+
+# configurations that are benchmarked by default: name -> options
+CONFIGURATIONS = [('fixed', {'adaptive_polling': False}),
+                  ('adaptive', {'adaptive_polling': True}),
+                  ('pid', {'adaptive_polling': True, 'pid_control': True}),
+                  ('predictive', {'adaptive_polling': True, 'predictive_control': True})]
+if vectorized.is_available():
+    CONFIGURATIONS += [('fixed-vectorized', {'adaptive_polling': False, 'vectorized': True}),
+                       ('adaptive-vectorized', {'adaptive_polling': True, 'vectorized': True})]
+
+class CallCounter(object):
+    """counts file system calls by wrapping the os functions and open()"""
+
+    def __init__(self):
+        self.counts = dict((name, 0) for name in COUNTED_CALLS)
+        self.originals = { }
+
+    def wrap(self, module, name, counter):
+        original = getattr(module, name)
+        self.originals[(module, name)] = original
+        counts = self.counts
+        def counted(*args, **kwargs):
+            counts[counter] += 1
+            return original(*args, **kwargs)
+        setattr(module, name, counted)
+
+    def install(self):
+        for name in ['open', 'read', 'write', 'lseek', 'close', 'stat']:
+            self.wrap(os, name, name)
+        self.wrap(__builtin__, 'open', 'open')
+
+    def uninstall(self):
+        for (module, name), original in self.originals.items():
+            setattr(module, name, original)
+        self.originals = { }
+
+    def total(self):
+        return sum(self.counts.values())
+
+class DecisionTimer(object):
+    """wraps the decide method of an engine and records how long every call takes"""
+
+    def __init__(self, engine):
+        self.samples = [ ]
+        decide = engine.decide
+        samples = self.samples
+        clock = time.time
+        def timed_decide(temps):
+            start = clock()
+            speed = decide(temps)
+            samples.append(clock() - start)
+            return speed
+        engine.decide = timed_decide
+
+def percentile(values, fraction):
+    """returns the given percentile of values (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = int(round(fraction * (len(ordered) - 1)))
+    return ordered[idx]
+
+def get_revision():
+    """returns the git revision of the source tree or None"""
+    try:
+        process = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = process.communicate()[0].strip()
+        if process.returncode == 0:
+            return output
+    except OSError:
+        pass
+    return None
+
+def run_configuration(name, options, duration, profile, data_dir, workload, trace):
+    """runs one configuration and returns its result record"""
+    control.use_vectorized = options.get('vectorized', False)
+    thermal = None
+    if trace is not None:
+        thermal = simulation.ReplayThermalDevice.from_file(trace)
+    sim = simulation.Simulation(workload=workload, profile=profile, data_dir=data_dir, thermal=thermal,
+                                thermal_file=True)
+    try:
+        sim.settings.adaptive_polling = options.get('adaptive_polling', True)
+        sim.settings.pid_control = options.get('pid_control', False)
+        sim.settings.predictive_control = options.get('predictive_control', False)
+        sim.settings.verify()
+        timer = DecisionTimer(sim.controller.engine)
+        counter = CallCounter()
+        tick_times = [ ]
+        keepalive_ticks = 0
+        objects = 0
+        allocated = 0
+        fan_reads = sim.fan.reads
+        level_writes = sim.fan.level_writes
+        watchdog_writes = sim.fan.watchdog_writes
+
+        end = sim.clock.now + duration
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        if tracemalloc is not None:
+            tracemalloc.start()
+        try:
+            while True:
+                due = sim.clock.next_due()
+                if due is None or due > end:
+                    break
+                sim.advance(due)
+                if sim.clock.next_callback() == sim.controller.keepalive.tick:
+                    # on real hardware the keepalive runs in a thread of its own,
+                    # only the polls are measured
+                    sim.clock.dispatch()
+                    keepalive_ticks += 1
+                    continue
+                if tracemalloc is not None:
+                    before_bytes = tracemalloc.get_traced_memory()[0]
+                before_objects = gc.get_count()[0]
+                counter.install()
+                start = time.time()
+                sim.clock.dispatch()
+                tick_times.append(time.time() - start)
+                counter.uninstall()
+                objects += gc.get_count()[0] - before_objects
+                if tracemalloc is not None:
+                    allocated += tracemalloc.get_traced_memory()[0] - before_bytes
+                gc.collect(0)
+        finally:
+            counter.uninstall()
+            if tracemalloc is not None:
+                tracemalloc.stop()
+            if gc_enabled:
+                gc.enable()
+
+        ticks = max(len(tick_times), 1)
+        result = {'configuration': name,
+                  'options': options,
+                  'revision': get_revision(),
+                  'version': build.version,
+                  'simulated_seconds': duration,
+                  'ticks': len(tick_times),
+                  'keepalive_ticks': keepalive_ticks,
+                  'wall_time_per_tick_us': sum(tick_times) / ticks * 1e6,
+                  'file_calls_per_tick': float(counter.total()) / ticks,
+                  'file_calls': counter.counts,
+                  'fan_reads_per_tick': float(sim.fan.reads - fan_reads) / ticks,
+                  'ec_level_writes': sim.fan.level_writes - level_writes,
+                  'ec_watchdog_writes': sim.fan.watchdog_writes - watchdog_writes,
+                  'watchdog_expiries': sim.fan.watchdog_expiries,
+                  'gc_objects_per_tick': float(objects) / ticks,
+                  'decision_latency_us': {'p50': percentile(timer.samples, 0.5) * 1e6,
+                                          'p90': percentile(timer.samples, 0.9) * 1e6,
+                                          'p99': percentile(timer.samples, 0.99) * 1e6,
+                                          'max': percentile(timer.samples, 1.0) * 1e6}}
+        if tracemalloc is not None:
+            result['allocated_bytes_per_tick'] = float(allocated) / ticks
+        return result
+    finally:
+        sim.close()
+        control.use_vectorized = False
+
+def compare(old_path, new_path):
+    """prints the relative change of the main metrics between two result files"""
+    old = dict((r['configuration'], r) for r in read_results(old_path))
+    new = dict((r['configuration'], r) for r in read_results(new_path))
+    metrics = ['wall_time_per_tick_us', 'file_calls_per_tick', 'ec_level_writes',
+               'ec_watchdog_writes', 'gc_objects_per_tick']
+    for name in sorted(set(old.keys()) & set(new.keys())):
+        print name
+        for metric in metrics:
+            a = old[name].get(metric, 0)
+            b = new[name].get(metric, 0)
+            change = (float(b) / a - 1.0) * 100.0 if a else 0.0
+            print '    %-24s %12.2f %12.2f %+8.1f%%' % (metric, a, b, change)
+        a = old[name]['decision_latency_us']['p99']
+        b = new[name]['decision_latency_us']['p99']
+        change = (float(b) / a - 1.0) * 100.0 if a else 0.0
+        print '    %-24s %12.2f %12.2f %+8.1f%%' % ('decision_p99_us', a, b, change)
+
+def read_results(path):
+    """reads a result file with one json record per line"""
+    results = [ ]
+    result_file = open(path, 'r')
+    try:
+        for line in result_file:
+            if line.strip():
+                results.append(json.loads(line))
+    finally:
+        result_file.close()
+    return results
+
+def main():
+    """runs the benchmark and writes one json record per configuration"""
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options] | --compare OLD NEW')
+    parser.add_option('--duration', type='float', default=3600.0,
+                      help='simulated time per configuration in seconds (default: %default)')
+    parser.add_option('--profile', help='fan profile to load')
+    parser.add_option('--data-dir', default=build.data_dir,
+                      help='directory containing models/ (default: %default)')
+    parser.add_option('--workload', help="workload trace with 'seconds watts' lines")
+    parser.add_option('--trace', help='recorded temperature trace in the tpfand.simulation csv format')
+    parser.add_option('--configuration', action='append',
+                      help='only run the named configuration, may be given more than once')
+    parser.add_option('--output', help='write the results to this file instead of stdout')
+    parser.add_option('--compare', action='store_true',
+                      help='compare two result files instead of running the benchmark')
+    options, args = parser.parse_args()
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error('--compare needs two result files')
+        compare(args[0], args[1])
+        return
+
+    workload = None
+    if options.workload:
+        workload = simulation.Workload.from_file(options.workload)
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'w')
+    try:
+        for name, config in CONFIGURATIONS:
+            if options.configuration and name not in options.configuration:
+                continue
+            result = run_configuration(name, config, options.duration, options.profile,
+                                       options.data_dir, workload, options.trace)
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    main()
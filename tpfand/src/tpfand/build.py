@@ -32,6 +32,12 @@ config_path = "/etc/tpfand.conf"
 # path to pid file
 pid_path = "/var/run/tpfand.pid"
 
+# directory of the telemetry log
+telemetry_dir = "/var/lib/tpfand/"
+
+# path to the cache of parsed profiles
+profile_cache_path = "/var/cache/tpfand/profiles"
+
 # version
 version = "0.95.3"
 
@@ -24,17 +24,28 @@ if not ('/usr/share/pyshared' in sys.path):
     sys.path.append('/usr/share/pyshared')
 
 import sys, os, os.path, time, signal
+
+from tpfand import startup
+
 import dbus, dbus.service, dbus.mainloop.glib, dbus.glib
+startup.timer.mark('import dbus')
 import gobject
+startup.timer.mark('import gobject')
 
-from tpfand import build, settings
+# modules only needed for optional features (vectorized, telemetry) are imported when enabled
+from tpfand import build, settings, profilecache, devices, triggers, scheduler, events, history, keepalive, \
+    limiter, pollstats
+startup.timer.mark('import tpfand')
 
-IBM_fan = '/proc/acpi/ibm/fan'
-IBM_thermal = '/proc/acpi/ibm/thermal'
+IBM_fan = devices.IBM_fan
+IBM_thermal = devices.IBM_thermal
 
 #debug
 debug = False
 
+# use the NumPy based decision engine
+use_vectorized = False
+
 # Configuration
 act_settings = None
 
@@ -44,6 +55,21 @@ controller = None
 class UnavailableException(dbus.DBusException):
     _dbus_error_name = "org.thinkpad.fancontrol.UnavailableException"    
 
+class MainLoopClock(object):
+    """wall clock and timers of the GLib main loop"""
+
+    def time(self):
+        """returns the current time in seconds"""
+        return time.time()
+
+    def timeout_add(self, interval, callback):
+        """calls callback after interval msecs, returns the timer id"""
+        return gobject.timeout_add(interval, callback)
+
+    def source_remove(self, timer):
+        """removes a pending timer"""
+        gobject.source_remove(timer)
+
 class Control(dbus.service.Object):
     """fan controller"""
     
@@ -53,10 +79,10 @@ class Control(dbus.service.Object):
     # the thinkpad_acpi watchdog accepts intervals between 1 and 120 seconds
     # for safety reasons one shouldn't use values higher than 5 seconds        
     watchdog_time = 5    
-    # value that temperature has to fall below to slow down fan  
-    current_trip_temps = { }
-    # current fan speeds required by sensor readings
-    current_trip_speeds = { }
+    # seconds a poll may be overdue before the keepalive lets the watchdog expire
+    stall_time = 10
+    # polls between the duration tables in the debug output
+    stats_report_polls = 100
     # last spinup time for interval cooling mode    
     last_interval_spinup = 0
     # fan in interval cooling mode
@@ -64,48 +90,117 @@ class Control(dbus.service.Object):
     # fan on in interval cooling mode
     #interval_running = False        
 
-    def __init__(self, bus, path):
+    def __init__(self, bus, path, fan=None, thermal=None, clock=None, fans=None):
         dbus.service.Object.__init__(self, bus, path)
+        # time source and timers, replaced by the simulation
+        self.clock = clock or MainLoopClock()
+        if fans is not None:
+            fan = fans[1]
+        fan_inputs = { }
+        if fan is None or thermal is None:
+            probed_fan, probed_thermal = devices.probe_devices()
+            if fan is None:
+                # further fans are only probed if fan 1 is not given
+                fans = devices.probe_fans(probed_fan)
+                fan = fans[1]
+                fan_inputs = devices.probe_fan_inputs(fans)
+            thermal = thermal or probed_thermal
+        # fan and thermal backends, they keep their files open between polls,
+        # self.fan is fan 1 of the fans by fan id
+        self.fans = fans or {1: fan}
+        self.fan_ids = sorted(self.fans.keys())
+        # fans that can only be watched and run at the level of fan 1
+        self.fan_inputs = fan_inputs
+        self.fan = fan
+        self.thermal = thermal
+        # durations of the poll phases
+        self.stats = pollstats.PollStats()
+        # rearms the watchdog between polls, in a thread of its own when running on the real clock
+        watchdog = self.fan.open_watchdog() if clock is None else None
+        if watchdog is not None:
+            self.keepalive = keepalive.WatchdogKeepalive(self.stats.timed('watchdog write', watchdog.rearm),
+                                                         self.watchdog_time)
+            self.keepalive.start()
+        else:
+            self.keepalive = keepalive.WatchdogKeepalive(self.stats.timed('watchdog write', self.fan.rearm),
+                                                         self.watchdog_time, self.clock.time)
+            self.clock.timeout_add(int(self.keepalive.interval * 1000), self.keepalive.tick)
+        # estimates how fast the temperatures change to choose the poll interval
+        self.scheduler = scheduler.AdaptiveScheduler()
+        # pending poll timer, time of the last and the next poll
+        self.poll_timer = None
+        self.last_poll_time = 0
+        self.next_poll_time = 0
+        # kernel thermal events that trigger an immediate poll
+        self.events = events.ThermalEventSource(self.thermal_event)
+        self.events_enabled = False
+        # readings and fan decision of the last poll
+        self.polled_temps = None
+        self.polled_speed = None
+        # results of the recent polls, and the on-disk log if enabled
+        self.history = history.History()
+        self.telemetry = None
+        # continuous controllers, only exist while pid_control / predictive_control is set
+        self.pid = None
+        self.predictive = None
+        # per sensor limits of the predictive controller and the tables they were taken from
+        self.predictive_limits = { }
+        self.predictive_tables = None
+        # values last sent with the change signals
+        self.signalled_temps = None
+        self.signalled_fan_state = None
+        self.signalled_trips = None
+        # trigger point evaluation per fan, keeps the hysteresis state,
+        # self.engine is the one of fan 1
+        vectorized = None
+        if use_vectorized:
+            from tpfand import vectorized
+            if not vectorized.is_available():
+                print 'Warning: NumPy is not installed, using the standard decision engine'
+                vectorized = None
+        self.engines = { }
+        for fan_id in self.fan_ids + self.fan_inputs.keys():
+            if vectorized is not None:
+                self.engines[fan_id] = vectorized.NumpyTriggerEngine()
+            else:
+                self.engines[fan_id] = triggers.TriggerEngine()
+        self.engine = self.engines[1]
+        # fan sections of the profile last checked against the fans
+        self.checked_fan_tables = None
+        # delays the level changes of every fan
+        self.limiters = dict((fan_id, limiter.TransitionLimiter()) for fan_id in self.fan_ids)
+        if debug:
+            for fan_id in self.fan_ids:
+                print 'Using the ' + self.fans[fan_id].name + ' backend for fan ' + str(fan_id)
+            for fan_id in sorted(self.fan_inputs.keys()):
+                print 'Fan ' + str(fan_id) + ' follows the level of fan 1'
+            print 'Using the ' + self.thermal.name + ' thermal backend'
         self.repoll(1)
     
-    def set_speed(self, speed):
-        """sets the fan speed (0=off, 2-8=normal, 254=disengaged, 255=ec, 256=full-speed)"""
-        fan_state = self.get_fan_state()
-        try:
+    def set_speed(self, speed, fan_id=1):
+        """sets the speed of the given fan (0=off, 2-8=normal, 254=disengaged, 255=ec, 256=full-speed)"""
+        fan = self.fans[fan_id]
+        if debug and fan.state is not None:
+            print '  Current level of fan ' + str(fan_id) + ' is ' + str(fan.state['level'])
+        # the watchdog covers all fans, the keepalive rearms it if the levels stay the same
+        start = pollstats.timer()
+        written = fan.set_speed(speed, self.watchdog_time, rearm=False)
+        if written:
+            self.stats.add('level write', pollstats.timer() - start)
+        elif fan.watchdog_rearmed:
+            self.stats.add('watchdog write', pollstats.timer() - start)
+        if fan.watchdog_rearmed:
+            self.keepalive.written()
+        if written:
             if debug:
-                print '  Rearming fan watchdog timer (+' + str(self.watchdog_time) + ' s)'
-                print '  Current fan level is ' + str(fan_state['level'])
-            fanfile = open(IBM_fan, 'w')
-            fanfile.write("watchdog %d" % self.watchdog_time)
-            fanfile.flush()            
-            if speed == fan_state['level']:
-                if debug:
-                    print '  -> Keeping the current fan level unchanged'
-            else:
-                if debug:
-                    print '  -> Setting fan level to ' + str(speed)
-                if speed == 0:
-                    fanfile.write('disable')
-                else:
-                    fanfile.write('enable')
-                    fanfile.flush()
-                    if speed == 254:
-                        fanfile.write("level disengaged")
-                    if speed == 255:
-                        fanfile.write("level auto")
-                    elif speed == 256:
-                        fanfile.write("level full-speed")
-                    else:
-                        fanfile.write("level %d" % (speed - 1))
-            fanfile.flush()            
-        except IOError:
-            # sometimes write fails during suspend/resume
-            pass
-        finally:
-            try:
-                fanfile.close()
-            except:
-                pass    
+                print '  -> Setting fan level to ' + str(speed)
+        elif debug:
+            print '  -> Keeping the current fan level unchanged'
+
+    def release_fans(self):
+        """hands all fans back to the EC"""
+        for fan_id in self.fan_ids:
+            self.set_speed(devices.SPEED_AUTO, fan_id)
 
     @dbus.service.method("org.thinkpad.fancontrol.Control", in_signature='', out_signature='s')         
     def get_version(self):
@@ -115,85 +210,348 @@ class Control(dbus.service.Object):
     def get_temperatures(self):
         """returns list of current sensor readings, +/-128 or 0 means sensor is disconnected"""
         try:
-            tempfile = open(IBM_thermal, 'r')
-            elements = tempfile.readline().split()[1:]
-            tempfile.close()
-            return map(int, elements)
-        except IOError, e:
+            return self.thermal.read_temperatures()
+        except (IOError, OSError), e:
             # sometimes read fails during suspend/resume        
-            raise UnavailableException(e.message)
-        finally:
-            try:
-                tempfile.close()
-            except:
-                pass
+            raise UnavailableException(str(e))
         
     @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a{si}')
     def get_fan_state(self):
         """Returns current (fan_level, fan_rpm)"""
         try:
-            fanfile = open(IBM_fan, 'r')
-            for line in fanfile.readlines():
-                key, value = line.split(':')
-                if key == 'speed':
-                    rpm = int(value.strip())
-                if key == 'level':
-                    value = value.strip()
-                    if value == '0':
-                        level = 0
-                    elif value == 'auto':
-                        level = 255
-                    elif value == 'disengaged' or value == 'full-speed':
-                        level = 256
-                    #Ugly stub for the removed interval mode
-                    elif value == 1:
-                        level = 2
-                    else:
-                        level = int(value) + 1 
-            #if act_settings.enabled and self.interval_mode:
-            #    level = 1
-            return {'level': level,
-                    'rpm': rpm }
+            return self.fan.read_state()
         except Exception, e:
-            raise UnavailableException(e.message)
-        finally:
-            try:
-                fanfile.close()
-            except:
-                pass
+            raise UnavailableException(str(e))
             
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='ai')
+    def get_fan_ids(self):
+        """returns the ids of the controlled fans, fan 1 is the one of get_fan_state"""
+        return self.fan_ids
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a{ia{si}}')
+    def get_fan_states(self):
+        """returns {fan id: {'level': fan_level, 'rpm': fan_rpm}} for all fans, including
+           the fans that are not in get_fan_ids and run at the level of fan 1"""
+        try:
+            states = dict((fan_id, self.fans[fan_id].read_state()) for fan_id in self.fan_ids)
+            for fan_id, fan_input in self.fan_inputs.items():
+                states[fan_id] = fan_input.read_state()
+            return states
+        except Exception, e:
+            raise UnavailableException(str(e))
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a{si}')
+    def get_transition_counters(self):
+        """returns the number of level changes of all fans that were applied, applied only
+           partially (limited), delayed (suppressed) and applied at once because of a critical
+           temperature (escalated)"""
+        counters = { }
+        for fan_limiter in self.limiters.values():
+            for name, count in fan_limiter.get_counters().items():
+                counters[name] = counters.get(name, 0) + count
+        return counters
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='(ada(siddau))')
+    def get_stats(self):
+        """returns (bucket upper bounds in seconds, [(phase, count, total seconds, max seconds,
+           bucket counts), ...]) for the phases of the polls, the last bucket has no upper bound"""
+        return (list(pollstats.BUCKETS), self.stats.get_stats())
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='')
+    def reset_stats(self):
+        """clears the poll phase histograms"""
+        self.stats.reset()
+
     @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='')            
     def reset_trips(self):
         """resets current trip points, should be called after config change"""
-        self.current_trip_speeds = { }
-        self.current_trip_temps = { }  
+        for engine in self.engines.values():
+            engine.reset()
+        # make the next poll report the new hysteresis state
+        self.signalled_trips = None
         
     @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a{ii}')
     def get_trip_temperatures(self):      
         """returns the current hysteresis temperatures for all sensors"""
-        return self.current_trip_temps
+        return self.engine.get_trip_temperatures()
     
     @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a{ii}')
     def get_trip_fan_speeds(self):      
         """returns the current hysteresis fan speeds for all sensors"""
-        return self.current_trip_speeds    
+        return self.engine.get_trip_speeds()
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='(aiiia{ii}a{ii}id)')
+    def get_snapshot(self):
+        """returns (temperatures, fan level, fan rpm, hysteresis temperatures, hysteresis fan speeds,
+           fan speed decided by the last poll or -1, time of the last poll) as captured by the last poll,
+           the readings of the virtual sensors follow the physical ones"""
+        temps = self.polled_temps
+        if temps is None:
+            # fan control is disabled and the poll did not read the sensors
+            temps = self.get_temperatures()
+        fan_state = self.fan.state
+        if fan_state is None:
+            fan_state = self.get_fan_state()
+        speed = self.polled_speed
+        if speed is None:
+            speed = -1
+        return (temps, fan_state['level'], fan_state['rpm'],
+                self.engine.get_trip_temperatures(), self.engine.get_trip_speeds(),
+                speed, float(self.last_poll_time))
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='di', out_signature='(adaaiaiai)')
+    def get_history(self, since_timestamp, max_points):
+        """returns (timestamps, temperatures, fan levels, fan rpms) of the polls after since_timestamp,
+           thinned out to at most max_points polls if max_points > 0"""
+        return self.history.get_since(since_timestamp, max_points)
+
+    @dbus.service.method('org.thinkpad.fancontrol.Control', in_signature='', out_signature='a(sd)')
+    def get_startup_times(self):
+        """returns [(phase, seconds), ...] for the phases of the daemon start up to the first poll"""
+        return startup.timer.get_phases()
+
+    @dbus.service.signal('org.thinkpad.fancontrol.Control', signature='ai')
+    def TemperaturesChanged(self, temperatures):
+        """emitted by poll when the sensor readings changed"""
+        pass
+
+    @dbus.service.signal('org.thinkpad.fancontrol.Control', signature='a{si}')
+    def FanStateChanged(self, fan_state):
+        """emitted by poll when the fan level or speed changed"""
+        pass
+
+    @dbus.service.signal('org.thinkpad.fancontrol.Control', signature='a{ii}a{ii}')
+    def TripsChanged(self, trip_temperatures, trip_fan_speeds):
+        """emitted by poll when the hysteresis temperatures or fan speeds changed"""
+        pass
+
+    def emit_changes(self, temps):
+        """emits the change signals for everything that changed since the last poll"""
+        temps_changed = temps is not None and temps != self.signalled_temps
+        if temps_changed:
+            self.signalled_temps = temps
+            self.TemperaturesChanged(temps)
+        # the hysteresis state only changes with the readings or after a reset
+        if temps_changed or (temps is not None and self.signalled_trips is None):
+            trips = (self.engine.get_trip_temperatures(), self.engine.get_trip_speeds())
+            if trips != self.signalled_trips:
+                self.signalled_trips = trips
+                self.TripsChanged(trips[0], trips[1])
+        fan_state = self.fan.state
+        if fan_state is not None and fan_state != self.signalled_fan_state:
+            self.signalled_fan_state = fan_state
+            self.FanStateChanged(fan_state)
+
+    def get_pid_speed(self, temps):
+        """returns the fan speed of the PID controller, None if pid_control is not set"""
+        if not act_settings.pid_control:
+            self.pid = None
+            return None
+        from tpfand import pid
+        if self.pid is None:
+            self.pid = pid.PIDController()
+        self.pid.set_parameters(act_settings.pid_setpoint, act_settings.pid_proportional / 100.0,
+                                act_settings.pid_integral / 1000.0, act_settings.pid_derivative / 100.0)
+        speed = self.pid.decide(temps, self.last_poll_time)
+        if debug:
+            print 'PID output: %.2f' % self.pid.output
+        return speed
+
+    def get_predictive_speed(self, temps, fan_speed):
+        """returns the fan speed of the predictive controller, None if predictive_control
+           is not set or the thermal models are not identified yet"""
+        if not act_settings.predictive_control:
+            self.predictive = None
+            return None
+        from tpfand import predictive
+        if self.predictive is None:
+            self.predictive = predictive.PredictiveController()
+        # every sensor is kept below the trigger point of its highest level
+        tables = act_settings.get_trigger_tables(1)
+        if tables is not self.predictive_tables:
+            self.predictive_tables = tables
+            self.predictive_limits = predictive.get_sensor_limits(dict(enumerate(tables.points)))
+        self.predictive.set_parameters(act_settings.predictive_limit, act_settings.predictive_horizon,
+                                       self.predictive_limits)
+        speed = self.predictive.decide(temps, fan_speed, self.last_poll_time)
+        if debug:
+            if speed is None:
+                print 'Predictive controller is identifying the thermal models'
+            else:
+                print 'Predicted margin to the limits: %.1f K' % self.predictive.get_margin(self.predictive.level)
+        return speed
+
+    def combine_speeds(self, trigger_speed, controller_speed):
+        """returns the speed of the continuous controller if there is one, trigger points
+           that demand the highest level, full-speed or the EC still win over it"""
+        if controller_speed is None:
+            return trigger_speed
+        from tpfand import pid
+        if trigger_speed >= pid.level_to_speed(pid.MAX_LEVEL):
+            return trigger_speed
+        return controller_speed
+
+    def check_fan_sections(self):
+        """warns about fan sections of the profile for fans that can't be set on their own"""
+        if act_settings.fan_trigger_tables is self.checked_fan_tables:
+            return
+        self.checked_fan_tables = act_settings.fan_trigger_tables
+        for fan_id in sorted(act_settings.fan_trigger_tables.keys()):
+            if fan_id in self.fan_inputs:
+                print 'Warning: fan ' + str(fan_id) + ' can not be set on its own, ' + \
+                      'its trigger points raise the level of fan 1'
+            elif fan_id not in self.fans:
+                print 'Warning: ignoring the trigger points of fan ' + str(fan_id) + \
+                      ', there is no such fan'
+
+    def get_trigger_speeds(self, temps):
+        """returns {fan id: speed} decided by the trigger points of every fan, the fans that
+           follow fan 1 raise its speed if they have trigger points of their own"""
+        speeds = { }
+        for fan_id in self.fan_ids:
+            engine = self.engines[fan_id]
+            engine.set_tables(act_settings.get_trigger_tables(fan_id))
+            speeds[fan_id] = engine.decide(temps)
+        for fan_id in self.fan_inputs.keys():
+            if fan_id in act_settings.fan_trigger_tables:
+                engine = self.engines[fan_id]
+                engine.set_tables(act_settings.fan_trigger_tables[fan_id])
+                speeds[1] = max(speeds[1], engine.decide(temps))
+        return speeds
+
+    def limit_transition(self, fan_id, speed, critical):
+        """returns the speed the given fan may change to now instead of speed"""
+        fan_limiter = self.limiters[fan_id]
+        fan_limiter.set_parameters(act_settings.level_dwell_time, act_settings.level_max_steps,
+                                   act_settings.level_step_interval)
+        state = self.fans[fan_id].state
+        if state is None:
+            return speed
+        limited = fan_limiter.limit(state['level'], speed, self.last_poll_time, critical)
+        if debug and limited != speed:
+            print '  Delaying the change of fan ' + str(fan_id) + ' to ' + str(speed) + \
+                  ', using ' + str(limited)
+        return limited
+
+    def record(self, temps, fan_state):
+        """adds the poll results to the history and the telemetry log"""
+        self.history.append(self.last_poll_time, temps, fan_state['level'], fan_state['rpm'])
+        if act_settings.telemetry_log:
+            try:
+                if self.telemetry is None:
+                    from tpfand import telemetry
+                    self.telemetry = telemetry.TelemetryLog()
+                self.telemetry.append(self.last_poll_time, temps, fan_state['level'], fan_state['rpm'])
+            except (IOError, OSError), ex:
+                print 'Error writing the telemetry log: ', ex
+                if self.telemetry is not None:
+                    self.telemetry.close()
+                    self.telemetry = None
+        elif self.telemetry is not None:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def update_event_source(self):
+        """starts or stops listening for thermal events after the setting changed"""
+        wanted = act_settings.enabled and act_settings.event_driven
+        if wanted == self.events_enabled:
+            return
+        self.events_enabled = wanted
+        if wanted:
+            if not self.events.start():
+                print 'Warning: no thermal event source available, polling the sensors instead'
+            elif debug:
+                print 'Listening for thermal events'
+        else:
+            self.events.stop()
+
+    def thermal_event(self):
+        """polls as soon as possible after a thermal event, but not more often than poll_min_time"""
+        now = self.clock.time()
+        delay = self.last_poll_time + act_settings.poll_min_time / 1000.0 - now
+        if debug:
+            print 'Thermal event received'
+        if delay <= 0:
+            self.repoll(1)
+        elif self.next_poll_time > now + delay:
+            self.repoll(delay * 1000)
+
+    def get_poll_interval(self, temps):
+        """returns the time in msecs until the next poll"""
+        if self.events.is_running():
+            # thermal events trigger the polls, the timer is only a fallback
+            return act_settings.poll_max_time
+        if not act_settings.adaptive_polling:
+            return self.poll_time
+        self.scheduler.update(self.clock.time(), temps)
+        # the fan whose next trigger point comes first decides
+        interval = min([self.scheduler.next_interval(act_settings.get_trigger_tables(fan_id),
+                                                     act_settings.poll_min_time,
+                                                     act_settings.poll_max_time)
+                        for fan_id in self.fan_ids])
+        if debug:
+            print 'Next poll in ' + str(interval) + ' ms'
+        return interval
 
     def repoll(self, interval):
-        """calls poll again after interval msecs"""
+        """calls poll again after interval msecs, replaces a pending poll"""
         ival = int(interval)
-        # ensure limits
-        # i.e. make sure that we always repoll before the watchdog timer runs out        
         if ival < 1: 
             ival = 1
-        if ival > self.watchdog_time * 1000:
-            ival = self.watchdog_time * 1000
+        # the keepalive rearms the watchdog until the poll is overdue
+        self.keepalive.extend(self.clock.time() + ival / 1000.0 + self.stall_time)
         
-        gobject.timeout_add(ival, self.poll)
+        if self.poll_timer is not None:
+            self.clock.source_remove(self.poll_timer)
+        self.poll_timer = self.clock.timeout_add(ival, self.poll)
+        self.next_poll_time = self.clock.time() + ival / 1000.0
             
+    def poll_now(self):
+        """polls immediately instead of waiting for the pending timer"""
+        if self.poll_timer is not None:
+            self.clock.source_remove(self.poll_timer)
+            self.poll_timer = None
+        self.poll()
+
     def poll(self):
-        """main fan control routine"""
-        # get the current fan level
-        fan_state = self.get_fan_state()
+        """main fan control routine, measures the durations of the poll phases"""
+        start = pollstats.timer()
+        self.stats.start_poll()
+        if self.poll_timer is not None:
+            # how late the main loop called the timer
+            self.stats.add('timer delay', max(self.clock.time() - self.next_poll_time, 0.0))
+        # the timer that called us is removed when we return False
+        self.poll_timer = None
+        self.control_fans()
+        self.stats.add('poll', pollstats.timer() - start)
+        if debug:
+            print 'Poll phases: ' + self.stats.format_last()
+            if self.stats.polls % self.stats_report_polls == 0:
+                print self.stats.format()
+        return False
+
+    def control_fans(self):
+        """reads the sensors and sets the fans"""
+        self.last_poll_time = self.clock.time()
+        self.update_event_source()
+        
+        self.polled_temps = None
+        self.polled_speed = None
+        
+        # get the current fan levels, these are the only fan reads per poll
+        start = pollstats.timer()
+        try:
+            fan_state = self.get_fan_state()
+            for fan_id in self.fan_ids[1:]:
+                self.fans[fan_id].read_state()
+        except (UnavailableException, IOError, OSError, ValueError):
+            fan_state = None
+        self.stats.add('fan read', pollstats.timer() - start)
+        if fan_state is None:
+            # fan read failed, hand control back to the EC
+            self.release_fans()
+            self.repoll(self.poll_time)
+            return
         
         if debug:
               print
@@ -211,54 +569,60 @@ class Control(dbus.service.Object):
             #    self.set_speed(level)
                         
             # read thermal data
+            start = pollstats.timer()
             try:
                 temps = self.get_temperatures()
             except UnavailableException:
+                temps = None
+            self.stats.add('thermal read', pollstats.timer() - start)
+            if temps is None:
                 # temperature read failed
-                self.set_speed(255)
+                self.release_fans()
                 self.repoll(self.poll_time)
-                return False
+                return
+
+            # append the readings of the virtual sensors
+            start = pollstats.timer()
+            temps = act_settings.virtual_plan.evaluate(temps, self.last_poll_time)
+
+            # look up the speed every fan requires in its compiled trigger tables,
+            # the continuous controllers drive all fans alike, the predictive one
+            # leaves the fans to the PID controller or the trigger points while it learns
+            controller_speed = self.get_predictive_speed(temps, fan_state['level'])
+            if controller_speed is None:
+                controller_speed = self.get_pid_speed(temps)
+            # level changes are only delayed below the critical temperature
+            critical = max([triggers.TEMP_MIN] + [temp for temp in temps if triggers.is_connected(temp)]) \
+                >= act_settings.critical_temperature
+            self.check_fan_sections()
+            trigger_speeds = self.get_trigger_speeds(temps)
+            speeds = [ ]
+            for fan_id in self.fan_ids:
+                new_speed = self.combine_speeds(trigger_speeds[fan_id], controller_speed)
+                speeds.append((fan_id, self.limit_transition(fan_id, new_speed, critical)))
+            self.stats.add('decision', pollstats.timer() - start)
 
-            new_speed = 0
-            if debug:
-                        print 'Current sensor values:'
-            for id in range(0, len(temps)):
-                temp = temps[id]                
-                # value is +/-128 or 0, if sensor is disconnected
-                if abs(temp) != 128 and abs(temp) != 0:
-                    points = act_settings.trigger_points[id]                    
-                    speed = 0
-                    
-                    if debug:                        
-                        print '    Sensor ' + str(id) +': ' + str(temp)                    
-                    # check if temperature is above hysteresis shutdown point
-                    if id in self.current_trip_temps:
-                        if temp >= self.current_trip_temps[id]:
-                            speed = self.current_trip_speeds[id]
-                        else:
-                            del self.current_trip_temps[id]
-                            del self.current_trip_speeds[id]
-                            
-                    # check if temperature is over trigger point
-                    for trigger_temp, trigger_speed in points.iteritems():
-                        if temp >= trigger_temp and speed < trigger_speed:
-                            self.current_trip_temps[id] = trigger_temp - act_settings.hysteresis
-                            self.current_trip_speeds[id] = trigger_speed
-                            speed = trigger_speed
-                    
-                    new_speed = max(new_speed, speed)
             if debug:
-                print 'Trying to set fan level to ' + str(new_speed) + ':'
-            # set fan speed
-            self.set_speed(new_speed)      
-            self.repoll(self.poll_time)
+                print 'Current sensor values:'
+                for id in range(0, len(temps)):
+                    if triggers.is_connected(temps[id]):
+                        print '    Sensor ' + str(id) +': ' + str(temps[id])
+            for fan_id, new_speed in speeds:
+                if debug:
+                    print 'Trying to set the level of fan ' + str(fan_id) + ' to ' + str(new_speed) + ':'
+                # set fan speed
+                self.set_speed(new_speed, fan_id)
+            self.polled_speed = speeds[0][1]
+            self.polled_temps = temps
+            if self.fan.state is not None:
+                self.record(temps, self.fan.state)
+            self.emit_changes(temps)
+            self.repoll(self.get_poll_interval(temps))
         else:
             # fan control disabled
-            self.set_speed(255)
+            self.release_fans()
+            self.emit_changes(None)
             self.repoll(self.poll_time)
-        
-        # remove current timer
-        return False
              
 def daemon_main():
     """daemon entry point"""  
@@ -267,16 +631,36 @@ def daemon_main():
     # register SIGTERM handler
     signal.signal(signal.SIGTERM, term_handler)    
     
-    # register d-bus service
+    # the watchdog keepalive runs in a thread of its own
+    gobject.threads_init()
+    dbus.mainloop.glib.threads_init()
+
+    # connect to the system bus
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
     system_bus = dbus.SystemBus()
-    name = dbus.service.BusName("org.thinkpad.fancontrol.tpfand", system_bus)
+    startup.timer.mark('bus connection')
 
     # create and load configuration
-    act_settings = settings.Settings(system_bus, '/Settings')
+    act_settings = settings.Settings(system_bus, '/Settings',
+                                     profile_cache=profilecache.ProfileCache(build.profile_cache_path))
+
+    # create controller and take over the fan right away,
+    # everything only needed by clients comes after the first poll
+    controller = Control(system_bus, '/Control')
+    startup.timer.mark('controller')
+    controller.poll_now()
+    startup.timer.mark('first poll')
 
-    # create controller
-    controller = Control(system_bus, '/Control')                  
+    # reload the config and the profiles when they are changed on disk
+    if not act_settings.start_watching() and debug:
+        print 'inotify is not available, changes of the config and the profiles need a reload'
+
+    # register d-bus service
+    name = dbus.service.BusName("org.thinkpad.fancontrol.tpfand", system_bus)
+    startup.timer.mark('bus name')
+    startup.timer.finish()
+    if debug:
+        print startup.timer.format()
 
     # start glib main loop          
     mainloop = gobject.MainLoop()  
@@ -284,7 +668,9 @@ def daemon_main():
 
 def term_handler(signum, frame):
     """Handles SIGTERM"""
-    controller.set_speed(255)
+    controller.release_fans()
+    controller.keepalive.stop()
+    act_settings.flush()
     try:
         os.remove(build.pid_path)
     except:
@@ -294,22 +680,17 @@ def term_handler(signum, frame):
 def is_system_suitable():
     """returns True iff fan speed setting, watchdog and thermal reading is supported by kernel and 
        we have write permissions"""
+    fan, thermal = devices.probe_devices()
     try:
-        fanfile = open(IBM_fan, 'w')
-        fanfile.write('level auto')
-        fanfile.flush()
-        fanfile.close()
-        fanfile = open(IBM_fan, 'w')
-        fanfile.write('watchdog 5')
-        fanfile.flush()
-        fanfile.close()
-        
-        tempfile = open(IBM_thermal, 'r')
-        tempfile.readline()
-        tempfile.close()
+        fan.write_speed(devices.SPEED_AUTO)
+        fan.write_watchdog(5)
+        thermal.read_temperatures()
         return True
-    except IOError:
-        return False         
+    except (IOError, OSError):
+        return False
+    finally:
+        fan.close()
+        thermal.close()
          
 def start_fan_control(quiet):
     """daemon start function"""
@@ -326,7 +707,10 @@ def start_fan_control(quiet):
     if debug:
         print 'Running in debug mode'
     
-    if not is_system_suitable():
+    startup.timer.mark('options')
+    suitable = is_system_suitable()
+    startup.timer.mark('system check')
+    if not suitable:
         print "Fatal error: unable to set fanspeed, enable watchdog or read temperature"
         print "             Please make sure you are root and a recent"
         print "             thinkpad_acpi module is loaded with fan_control=1"
@@ -382,12 +766,13 @@ def daemonize():
             sys.exit(1)
     
     # start the daemon main loop
+    startup.timer.mark('daemonize')
     daemon_main()   
     
     
 def main():
     quiet = False
-    global debug
+    global debug, use_vectorized
     
     if "--quiet" in sys.argv:
         quiet = True
@@ -395,6 +780,9 @@ def main():
     if "--debug" in sys.argv:
         debug = True
         
+    if "--vectorized" in sys.argv:
+        use_vectorized = True
+        
     start_fan_control(quiet)     
 
 if __name__ == "__main__":
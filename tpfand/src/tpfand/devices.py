@@ -0,0 +1,481 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path, glob, errno
+
+# thinkpad_acpi procfs interface
+IBM_fan = '/proc/acpi/ibm/fan'
+IBM_thermal = '/proc/acpi/ibm/thermal'
+
+# thinkpad_acpi hwmon interface
+HWMON_class = '/sys/class/hwmon'
+HWMON_name = 'thinkpad'
+HWMON_watchdog = '/sys/bus/platform/drivers/thinkpad_hwmon/fan_watchdog'
+
+# special fan speeds, everything in between 2 and 8 is a normal fan level + 1
+SPEED_OFF = 0
+SPEED_DISENGAGED = 254
+SPEED_AUTO = 255
+SPEED_FULL = 256
+
+# number of temperature sensors reported by thinkpad_acpi
+SENSOR_COUNT = 16
+
+class Device(object):
+    """file backed device that keeps its file descriptors open between polls"""
+
+    def __init__(self):
+        self.fds = { }
+
+    def get_fd(self, path, flags):
+        """returns an open file descriptor for path, opens it on first use"""
+        fd = self.fds.get((path, flags))
+        if fd is None:
+            fd = os.open(path, flags)
+            self.fds[(path, flags)] = fd
+        return fd
+
+    def read_file(self, path):
+        """rereads the whole content of an already opened file"""
+        fd = self.get_fd(path, os.O_RDONLY)
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            return os.read(fd, 4096)
+        except OSError, e:
+            self.close_file(path, os.O_RDONLY, e)
+            raise
+
+    def write_file(self, path, data):
+        """writes data to an already opened file with a single write call"""
+        fd = self.get_fd(path, os.O_WRONLY)
+        try:
+            os.write(fd, data)
+        except OSError, e:
+            self.close_file(path, os.O_WRONLY, e)
+            raise
+
+    def close_file(self, path, flags, error):
+        """closes the file descriptor of path after error, it is reopened on the next access.
+           Absent sensors fail with ENXIO on every read, their descriptors are kept."""
+        if error.errno == errno.ENXIO:
+            return
+        fd = self.fds.pop((path, flags), None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def close(self):
+        """closes all open file descriptors, they are reopened on the next access"""
+        for fd in self.fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = { }
+
+class FanDevice(Device):
+    """fan backend, caches the last commanded and the last observed fan state"""
+
+    # name of the backend
+    name = None
+
+    def __init__(self):
+        Device.__init__(self)
+        # last state read from the hardware ({'level': ..., 'rpm': ...})
+        self.state = None
+        # last speed written to the hardware
+        self.commanded = None
+        # watchdog interval that is currently armed
+        self.armed_watchdog = None
+        # True if the last set_speed wrote to the fan, every write rearms the watchdog
+        self.watchdog_rearmed = False
+        # number of state reads, level writes and watchdog writes issued
+        self.reads = 0
+        self.level_writes = 0
+        self.watchdog_writes = 0
+
+    def read_state(self):
+        """reads and caches the fan state, returns {'level': level, 'rpm': rpm}"""
+        self.reads += 1
+        try:
+            self.state = self.read_hw_state()
+        except (IOError, OSError, ValueError):
+            self.invalidate()
+            raise
+        return self.state
+
+    def get_state(self):
+        """returns the cached fan state, reads it if nothing is cached yet"""
+        if self.state is None:
+            return self.read_state()
+        return self.state
+
+    def set_speed(self, speed, watchdog, rearm=True):
+        """sets the fan speed and keeps the watchdog armed, an unchanged level only rearms
+           the watchdog if rearm is set, returns True if the fan level had to be written"""
+        try:
+            written = False
+            rearmed = False
+            if self.armed_watchdog != watchdog:
+                self.write_watchdog(watchdog)
+                self.armed_watchdog = watchdog
+                self.watchdog_writes += 1
+                rearmed = True
+            level = self.state['level'] if self.state is not None else None
+            if observed_speed(speed) != level or speed != self.commanded:
+                self.write_speed(speed)
+                self.level_writes += 1
+                written = True
+            elif rearm and not rearmed:
+                # every successful write rearms the watchdog, so only
+                # touch it explicitly when the level stays the same
+                self.rearm_watchdog(watchdog)
+                self.watchdog_writes += 1
+            self.commanded = speed
+            self.watchdog_rearmed = written or rearmed or rearm
+            if self.state is not None:
+                self.state = {'level': observed_speed(speed), 'rpm': self.state['rpm']}
+            return written
+        except (IOError, OSError):
+            # sometimes writes fail during suspend/resume
+            self.invalidate()
+            return False
+
+    def rearm(self, watchdog):
+        """rearms the watchdog without touching the fan level"""
+        try:
+            self.rearm_watchdog(watchdog)
+            self.watchdog_writes += 1
+        except (IOError, OSError):
+            self.invalidate()
+            raise
+
+    def open_watchdog(self):
+        """returns a WatchdogDevice with file descriptors of its own that may be used
+           from another thread, or None if the watchdog can only be rearmed through rearm()"""
+        return None
+
+    def invalidate(self):
+        """forgets all cached state, e.g. after a failed read or write"""
+        self.close()
+        self.state = None
+        self.commanded = None
+        self.armed_watchdog = None
+        self.watchdog_rearmed = False
+
+    def is_available(self):
+        """returns True if the device exists and is writable"""
+        raise NotImplementedError()
+
+    def read_hw_state(self):
+        """reads the fan state from the hardware"""
+        raise NotImplementedError()
+
+    def write_speed(self, speed):
+        """writes the fan speed to the hardware"""
+        raise NotImplementedError()
+
+    def write_watchdog(self, watchdog):
+        """sets the watchdog interval"""
+        raise NotImplementedError()
+
+    def rearm_watchdog(self, watchdog):
+        """restarts the watchdog timer"""
+        self.write_watchdog(watchdog)
+
+class ProcFanDevice(FanDevice):
+    """fan controlled through /proc/acpi/ibm/fan"""
+
+    name = 'procfs'
+
+    def __init__(self, path=IBM_fan):
+        FanDevice.__init__(self)
+        self.path = path
+
+    def is_available(self):
+        return os.path.isfile(self.path) and os.access(self.path, os.W_OK)
+
+    def read_hw_state(self):
+        level = None
+        rpm = 0
+        for line in self.read_file(self.path).splitlines():
+            if not ':' in line:
+                continue
+            key, value = line.split(':', 1)
+            value = value.strip()
+            if key == 'speed':
+                rpm = int(value)
+            elif key == 'level':
+                level = parse_proc_level(value)
+        if level is None:
+            raise ValueError('no fan level in ' + self.path)
+        return {'level': level,
+                'rpm': rpm }
+
+    def write_speed(self, speed):
+        # 'level' implies 'enable', so a level change is a single EC write
+        if speed == SPEED_OFF:
+            self.write_file(self.path, 'disable')
+        elif speed == SPEED_DISENGAGED:
+            self.write_file(self.path, 'level disengaged')
+        elif speed == SPEED_AUTO:
+            self.write_file(self.path, 'level auto')
+        elif speed == SPEED_FULL:
+            self.write_file(self.path, 'level full-speed')
+        else:
+            self.write_file(self.path, 'level %d' % max(speed - 1, 0))
+
+    def write_watchdog(self, watchdog):
+        self.write_file(self.path, 'watchdog %d' % watchdog)
+
+    def open_watchdog(self):
+        return WatchdogDevice(self.path, 'watchdog %d')
+
+class HwmonFanDevice(FanDevice):
+    """fan controlled through the thinkpad hwmon pwmN/pwmN_enable attributes"""
+
+    name = 'hwmon'
+
+    def __init__(self, path, watchdog_path=HWMON_watchdog, index=1):
+        FanDevice.__init__(self)
+        self.path = path
+        self.index = index
+        if index != 1:
+            self.name = 'hwmon fan%d' % index
+        self.pwm_path = os.path.join(path, 'pwm%d' % index)
+        self.enable_path = os.path.join(path, 'pwm%d_enable' % index)
+        self.rpm_path = os.path.join(path, 'fan%d_input' % index)
+        self.watchdog_path = watchdog_path
+
+    def is_available(self):
+        return os.path.isfile(self.pwm_path) and os.access(self.pwm_path, os.W_OK) \
+            and os.access(self.enable_path, os.W_OK)
+
+    def read_hw_state(self):
+        enable = int(self.read_file(self.enable_path))
+        rpm = int(self.read_file(self.rpm_path))
+        if enable == 0:
+            level = SPEED_FULL
+        elif enable == 1:
+            pwm_level = int(self.read_file(self.pwm_path)) >> 5
+            if pwm_level == 0:
+                level = SPEED_OFF
+            else:
+                level = pwm_level + 1
+        else:
+            level = SPEED_AUTO
+        return {'level': level,
+                'rpm': rpm }
+
+    def write_speed(self, speed):
+        if speed in (SPEED_DISENGAGED, SPEED_FULL):
+            self.write_file(self.enable_path, '0')
+        elif speed == SPEED_AUTO:
+            self.write_file(self.enable_path, '2')
+        else:
+            self.write_file(self.enable_path, '1')
+            self.write_file(self.pwm_path, str(max(speed - 1, 0) * 255 / 7))
+
+    def write_watchdog(self, watchdog):
+        if os.path.exists(self.watchdog_path):
+            self.write_file(self.watchdog_path, str(watchdog))
+
+    def open_watchdog(self):
+        if os.path.exists(self.watchdog_path):
+            return WatchdogDevice(self.watchdog_path, '%d')
+        return None
+
+class WatchdogDevice(Device):
+    """fan watchdog with a file descriptor of its own"""
+
+    def __init__(self, path, format):
+        Device.__init__(self)
+        self.path = path
+        self.format = format
+
+    def rearm(self, watchdog):
+        """restarts the watchdog timer"""
+        self.write_file(self.path, self.format % watchdog)
+
+class ThermalDevice(Device):
+    """temperature backend"""
+
+    # name of the backend
+    name = None
+
+    def is_available(self):
+        """returns True if temperatures can be read"""
+        raise NotImplementedError()
+
+    def read_temperatures(self):
+        """returns a list of sensor readings, +/-128 or 0 means sensor is disconnected"""
+        raise NotImplementedError()
+
+class ProcThermalDevice(ThermalDevice):
+    """temperatures read from /proc/acpi/ibm/thermal"""
+
+    name = 'procfs'
+
+    def __init__(self, path=IBM_thermal):
+        ThermalDevice.__init__(self)
+        self.path = path
+
+    def is_available(self):
+        return os.path.isfile(self.path) and os.access(self.path, os.R_OK)
+
+    def read_temperatures(self):
+        return map(int, self.read_file(self.path).split()[1:])
+
+class HwmonThermalDevice(ThermalDevice):
+    """temperatures read from the thinkpad hwmon temp*_input attributes"""
+
+    name = 'hwmon'
+
+    def __init__(self, path, count=SENSOR_COUNT):
+        ThermalDevice.__init__(self)
+        self.path = path
+        self.paths = [os.path.join(path, 'temp%d_input' % (n + 1)) for n in range(0, count)]
+
+    def is_available(self):
+        return os.path.isfile(self.paths[0])
+
+    def read_temperatures(self):
+        temps = [ ]
+        for path in self.paths:
+            try:
+                temps.append(int(self.read_file(path)) / 1000)
+            except (IOError, OSError, ValueError):
+                # missing sensors return ENXIO
+                temps.append(-128)
+        return temps
+
+class HwmonFanInput(FanDevice):
+    """fan that thinkpad_acpi only exposes through the hwmon fanN_input attribute,
+       it runs at the level set for fan 1"""
+
+    def __init__(self, path, index, leader):
+        FanDevice.__init__(self)
+        self.index = index
+        self.name = 'hwmon fan%d input' % index
+        self.rpm_path = os.path.join(path, 'fan%d_input' % index)
+        # fan device whose level this fan follows
+        self.leader = leader
+
+    def is_available(self):
+        return os.path.isfile(self.rpm_path)
+
+    def read_hw_state(self):
+        return {'level': self.leader.get_state()['level'],
+                'rpm': int(self.read_file(self.rpm_path)) }
+
+def observed_speed(speed):
+    """returns the speed the hardware reports after speed has been set"""
+    if speed == 1:
+        # interval cooling mode is no longer supported and turns the fan off
+        return SPEED_OFF
+    if speed == SPEED_DISENGAGED:
+        return SPEED_FULL
+    return speed
+
+def parse_proc_level(value):
+    """converts the level reported by /proc/acpi/ibm/fan to a fan speed"""
+    if value == '0':
+        return SPEED_OFF
+    elif value == 'auto':
+        return SPEED_AUTO
+    elif value == 'disengaged' or value == 'full-speed':
+        return SPEED_FULL
+    else:
+        return int(value) + 1
+
+def find_hwmon():
+    """returns the directory of the thinkpad hwmon device or None"""
+    for name_path in glob.glob(os.path.join(HWMON_class, '*', 'name')) + \
+                     glob.glob(os.path.join(HWMON_class, '*', 'device', 'name')):
+        try:
+            name_file = open(name_path, 'r')
+            try:
+                name = name_file.read().strip()
+            finally:
+                name_file.close()
+        except IOError:
+            continue
+        if name == HWMON_name:
+            return os.path.dirname(name_path)
+    return None
+
+def probe_devices():
+    """returns (fan device, thermal device) for the best available backend"""
+    fan = ProcFanDevice()
+    thermal = ProcThermalDevice()
+    if not fan.is_available() or not thermal.is_available():
+        hwmon_path = find_hwmon()
+        if hwmon_path is not None:
+            if not fan.is_available():
+                fan = HwmonFanDevice(hwmon_path)
+            if not thermal.is_available():
+                thermal = HwmonThermalDevice(hwmon_path)
+    return fan, thermal
+
+def probe_fans(fan=None):
+    """returns {fan id: fan device}, fan 1 is the fan of probe_devices(), further fans
+       can only be set independently through the hwmon pwm2, pwm3, ... attributes"""
+    if fan is None:
+        fan = probe_devices()[0]
+    fans = {1: fan}
+    hwmon_path = find_hwmon()
+    if hwmon_path is None:
+        return fans
+    index = 2
+    while True:
+        extra = HwmonFanDevice(hwmon_path, index=index)
+        if not extra.is_available():
+            break
+        fans[index] = extra
+        index += 1
+    if len(fans) > 1 and not isinstance(fan, HwmonFanDevice):
+        # the procfs level applies to all fans at once, use hwmon for fan 1 as well
+        fan.close()
+        fans[1] = HwmonFanDevice(hwmon_path)
+    return fans
+
+def probe_fan_inputs(fans):
+    """returns {fan id: HwmonFanInput} for the fans after the given ones that can only be
+       watched, dual fan ThinkPads expose fan2_input but no pwm2"""
+    inputs = { }
+    hwmon_path = find_hwmon()
+    if hwmon_path is None:
+        return inputs
+    index = 2
+    while True:
+        if index not in fans:
+            fan_input = HwmonFanInput(hwmon_path, index, fans[1])
+            if not fan_input.is_available():
+                break
+            inputs[index] = fan_input
+        index += 1
+    return inputs
@@ -0,0 +1,136 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path, glob, socket
+import gobject
+
+# netlink protocol of the kernel uevent broadcasts
+NETLINK_KOBJECT_UEVENT = 15
+
+# sysfs attributes that are updated with sysfs_notify() and can be polled,
+# the trip_point_*_temp attributes of the thermal zones are static and never notify
+POLLABLE_ATTRIBUTES = ['/sys/class/hwmon/*/temp*_alarm',
+                       '/sys/class/hwmon/*/temp*_crit_alarm',
+                       '/sys/class/hwmon/*/device/temp*_alarm']
+
+# subsystems whose uevents cause a poll
+UEVENT_SUBSYSTEMS = ['thermal', 'hwmon']
+
+class ThermalEventSource(object):
+    """calls callback when the kernel reports a thermal event, either through a
+       pollable sysfs attribute or through a thermal/hwmon uevent.
+       The uevents only add wakeups, the EC temperatures of a ThinkPad never send one."""
+
+    def __init__(self, callback, patterns=POLLABLE_ATTRIBUTES):
+        self.callback = callback
+        self.patterns = patterns
+        self.fds = [ ]
+        self.watches = [ ]
+        self.uevent_socket = None
+
+    def is_running(self):
+        """returns True if at least one attribute that notifies is watched"""
+        return len(self.fds) > 0
+
+    def start(self):
+        """starts watching all available event sources, returns False and watches
+           nothing if there is no attribute that notifies"""
+        for pattern in self.patterns:
+            for path in glob.glob(pattern):
+                self.watch_attribute(path)
+        if not self.is_running():
+            return False
+        self.watch_uevents()
+        return True
+
+    def stop(self):
+        """stops watching all event sources"""
+        for watch in self.watches:
+            gobject.source_remove(watch)
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.uevent_socket is not None:
+            self.uevent_socket.close()
+        self.watches = [ ]
+        self.fds = [ ]
+        self.uevent_socket = None
+
+    def watch_attribute(self, path):
+        """watches a sysfs attribute for sysfs_notify() wakeups"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            # the attribute has to be read once before poll() reports changes
+            os.read(fd, 4096)
+        except OSError:
+            os.close(fd)
+            return
+        self.fds.append(fd)
+        self.watches.append(gobject.io_add_watch(fd, gobject.IO_PRI | gobject.IO_ERR,
+                                                 self.attribute_changed))
+
+    def watch_uevents(self):
+        """subscribes to the kernel uevent broadcasts"""
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.bind((os.getpid(), 1))
+        except (socket.error, AttributeError):
+            return
+        self.uevent_socket = sock
+        self.watches.append(gobject.io_add_watch(sock.fileno(), gobject.IO_IN,
+                                                 self.uevent_received))
+
+    def attribute_changed(self, fd, condition):
+        """handles a wakeup of a sysfs attribute"""
+        try:
+            # rereading the attribute rearms the notification
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.read(fd, 4096)
+        except OSError:
+            pass
+        self.callback()
+        return True
+
+    def uevent_received(self, fd, condition):
+        """handles a kernel uevent"""
+        try:
+            data = self.uevent_socket.recv(8192)
+        except socket.error:
+            return True
+        if is_thermal_uevent(data):
+            self.callback()
+        return True
+
+def is_thermal_uevent(data):
+    """returns True if the raw uevent message belongs to a thermal or hwmon device"""
+    for field in data.split('\0'):
+        if field.startswith('SUBSYSTEM='):
+            return field[len('SUBSYSTEM='):] in UEVENT_SUBSYSTEMS
+    return False
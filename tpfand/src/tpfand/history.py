@@ -0,0 +1,118 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+from array import array
+
+from tpfand import devices
+
+# number of polls kept in the history, 8192 polls use about 230 KB
+HISTORY_SIZE = 8192
+
+class History(object):
+    """fixed size ring buffer of poll results, stored in flat arrays"""
+
+    def __init__(self, capacity=HISTORY_SIZE, sensor_count=devices.SENSOR_COUNT):
+        self.capacity = capacity
+        self.sensor_count = sensor_count
+        self.times = array('d', [0.0]) * capacity
+        # temperatures are stored as signed bytes, sensor_count per poll
+        self.temps = array('b', [0]) * (capacity * sensor_count)
+        self.levels = array('H', [0]) * capacity
+        self.rpms = array('H', [0]) * capacity
+        # index of the oldest entry and number of entries
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        """removes all entries"""
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp, temps, level, rpm):
+        """adds the result of a poll, overwrites the oldest entry when full"""
+        if self.count < self.capacity:
+            idx = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            idx = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[idx] = timestamp
+        self.levels[idx] = min(max(level, 0), 0xffff)
+        self.rpms[idx] = min(max(rpm, 0), 0xffff)
+        base = idx * self.sensor_count
+        store = self.temps
+        for n in xrange(0, self.sensor_count):
+            if n < len(temps):
+                temp = temps[n]
+                if temp < -128:
+                    temp = -128
+                elif temp > 127:
+                    temp = 127
+            else:
+                temp = -128
+            store[base + n] = temp
+
+    def find(self, since):
+        """returns the position (0 = oldest) of the first entry newer than since"""
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.times[(self.start + mid) % self.capacity] > since:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def get_since(self, since, max_points=0):
+        """returns (timestamps, temperatures, levels, rpms) of all entries newer than since,
+           evenly thinned out to at most max_points entries if max_points > 0"""
+        first = self.find(since)
+        available = self.count - first
+        step = 1
+        if max_points > 0 and available > max_points:
+            step = (available + max_points - 1) / max_points
+        times = [ ]
+        temps = [ ]
+        levels = [ ]
+        rpms = [ ]
+        # walk backwards from the newest entry, so the latest poll is always included
+        pos = self.count - 1
+        while pos >= first:
+            idx = (self.start + pos) % self.capacity
+            base = idx * self.sensor_count
+            times.append(self.times[idx])
+            temps.append(self.temps[base:base + self.sensor_count].tolist())
+            levels.append(self.levels[idx])
+            rpms.append(self.rpms[idx])
+            pos -= step
+        times.reverse()
+        temps.reverse()
+        levels.reverse()
+        rpms.reverse()
+        return times, temps, levels, rpms
@@ -0,0 +1,147 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path, errno, struct, ctypes, ctypes.util
+import gobject
+
+# flags of inotify_init1
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 02000000
+
+# event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# changes of files in a directory that are complete when reported,
+# partial writes are only reported once the file is closed
+FILE_CHANGES = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event without the name
+EVENT = struct.Struct('iIII')
+
+libc = None
+
+def get_libc():
+    """returns the C library with the inotify functions, or None"""
+    global libc
+    if libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch
+        except (OSError, AttributeError):
+            libc = False
+    return libc or None
+
+def parse_events(data):
+    """returns [(watch descriptor, mask, name), ...] for the events read from an inotify fd"""
+    events = [ ]
+    offset = 0
+    while offset + EVENT.size <= len(data):
+        wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+        offset += EVENT.size
+        name = data[offset:offset + length].rstrip('\0')
+        offset += length
+        events.append((wd, mask, name))
+    return events
+
+class DirectoryWatcher(object):
+    """reports changed files in a set of directories from the GLib main loop,
+       callback is called with the path of the file or with None if events were lost"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.fd = None
+        self.watch = None
+        # watch descriptor -> directory
+        self.directories = { }
+
+    def is_running(self):
+        return self.fd is not None
+
+    def start(self):
+        """opens the inotify instance, returns False if inotify is not available"""
+        if self.fd is not None:
+            return True
+        c = get_libc()
+        if c is None:
+            return False
+        fd = c.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self.fd = fd
+        self.watch = gobject.io_add_watch(fd, gobject.IO_IN, self.handle_events)
+        return True
+
+    def stop(self):
+        """removes all watches"""
+        if self.watch is not None:
+            gobject.source_remove(self.watch)
+            self.watch = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.directories = { }
+
+    def add_directory(self, path, mask=FILE_CHANGES):
+        """watches the files in directory path, returns False if it can't be watched"""
+        if self.fd is None:
+            return False
+        wd = get_libc().inotify_add_watch(self.fd, path, mask | IN_ONLYDIR)
+        if wd < 0:
+            return False
+        self.directories[wd] = path
+        return True
+
+    def handle_events(self, source, condition):
+        """reads all pending events, called by the main loop"""
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError, ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                if ex.errno != errno.EAGAIN:
+                    print 'Error reading inotify events: ', ex
+                break
+            if not data:
+                break
+            for wd, mask, name in parse_events(data):
+                if mask & IN_Q_OVERFLOW:
+                    self.callback(None)
+                elif mask & IN_IGNORED:
+                    self.directories.pop(wd, None)
+                elif wd in self.directories and name:
+                    self.callback(os.path.join(self.directories[wd], name))
+        return True
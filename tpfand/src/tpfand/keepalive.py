@@ -0,0 +1,83 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import time, thread
+
+class WatchdogKeepalive(object):
+    """rearms the fan watchdog on its own schedule, independent of the poll interval.
+       It only rearms until the deadline set by the controller, so the watchdog still
+       hands the fan to the EC if the controller stops polling."""
+
+    def __init__(self, rearm, watchdog_time, clock=time.time):
+        # rearm(watchdog_time) writes the watchdog
+        self.rearm = rearm
+        self.watchdog_time = watchdog_time
+        self.clock = clock
+        # how often the keepalive checks the watchdog and how old the last write may get
+        self.interval = 1.0
+        self.rearm_after = max(watchdog_time - 2.0 * self.interval, self.interval)
+        self.last_write = None
+        self.deadline = 0.0
+        self.running = False
+        # number of watchdog writes issued by the keepalive
+        self.writes = 0
+
+    def written(self):
+        """called after every write to the fan, each write rearms the watchdog"""
+        self.last_write = self.clock()
+
+    def extend(self, deadline):
+        """keeps the watchdog armed until deadline"""
+        self.deadline = deadline
+
+    def tick(self):
+        """rearms the watchdog if needed, returns True to keep a GLib timer running"""
+        now = self.clock()
+        if now < self.deadline and (self.last_write is None or now - self.last_write >= self.rearm_after):
+            try:
+                self.rearm(self.watchdog_time)
+                self.writes += 1
+                self.last_write = now
+            except (IOError, OSError):
+                # fails during suspend/resume, the next tick tries again
+                pass
+        return True
+
+    def start(self):
+        """runs the keepalive in a thread of its own, so a poll blocked in a slow
+           EC read can't let the watchdog expire"""
+        if not self.running:
+            self.running = True
+            thread.start_new_thread(self.run, ())
+
+    def stop(self):
+        """ends the keepalive thread"""
+        self.running = False
+
+    def run(self):
+        while self.running:
+            time.sleep(self.interval)
+            if self.running:
+                self.tick()
@@ -0,0 +1,111 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+from tpfand import devices, pid
+
+def is_level(speed):
+    """returns True for the off state and the normal levels, which change gradually"""
+    return speed == devices.SPEED_OFF or 2 <= speed <= 8
+
+def get_level(speed):
+    """returns the fan level 0-7 of the off state or a normal level"""
+    return max(speed - 1, 0)
+
+class TransitionLimiter(object):
+    """delays fan level changes: a level is kept for at least dwell_time seconds and
+       the level moves by at most max_steps within step_interval seconds, critical
+       temperatures bypass both and the EC, full-speed and disengaged mode are
+       entered and left at once"""
+
+    def __init__(self, dwell_time=0, max_steps=0, step_interval=10):
+        self.set_parameters(dwell_time, max_steps, step_interval)
+        # time of the last level change and (time, steps) of the changes within step_interval
+        self.last_change = None
+        self.recent_steps = [ ]
+        # target that is currently held back, each target is counted as suppressed once
+        self.held = None
+        # number of changes made, made only partially, delayed and made at once
+        # because of a critical temperature
+        self.applied = 0
+        self.limited = 0
+        self.suppressed = 0
+        self.escalated = 0
+
+    def set_parameters(self, dwell_time, max_steps, step_interval):
+        """changes the limits, 0 disables the dwell time or the step limit"""
+        self.dwell_time = dwell_time
+        self.max_steps = max_steps
+        self.step_interval = step_interval
+
+    def get_counters(self):
+        """returns the transition counters"""
+        return {'applied': self.applied,
+                'limited': self.limited,
+                'suppressed': self.suppressed,
+                'escalated': self.escalated }
+
+    def limit(self, current, wanted, now, critical=False):
+        """returns the speed to set at time now instead of wanted while the fan runs at current"""
+        if wanted == current:
+            self.held = None
+            return wanted
+        if critical:
+            self.escalated += 1
+            return self.change(wanted, 0, now)
+        if not is_level(current) or not is_level(wanted):
+            return self.change(wanted, 0, now)
+        if self.last_change is not None and self.last_change <= now < self.last_change + self.dwell_time:
+            return self.suppress(current, wanted)
+        steps = abs(get_level(wanted) - get_level(current))
+        if self.max_steps > 0:
+            self.recent_steps = [(time, count) for time, count in self.recent_steps
+                                 if now - self.step_interval < time <= now]
+            allowed = self.max_steps - sum([count for time, count in self.recent_steps])
+            if allowed <= 0:
+                return self.suppress(current, wanted)
+            if steps > allowed:
+                self.limited += 1
+                if wanted > current:
+                    wanted = pid.level_to_speed(get_level(current) + allowed)
+                else:
+                    wanted = pid.level_to_speed(get_level(current) - allowed)
+                steps = allowed
+        return self.change(wanted, steps, now)
+
+    def suppress(self, current, wanted):
+        """keeps the current speed, counts wanted as suppressed the first time it is held back"""
+        if wanted != self.held:
+            self.suppressed += 1
+            self.held = wanted
+        return current
+
+    def change(self, speed, steps, now):
+        """records a level change"""
+        self.held = None
+        self.applied += 1
+        self.last_change = now
+        if steps > 0:
+            self.recent_steps.append((now, steps))
+        return speed
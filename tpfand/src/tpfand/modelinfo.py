@@ -0,0 +1,117 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os.path
+
+# directory of the DMI attributes exported by the kernel
+DMI_dir = "/sys/class/dmi/id/"
+
+class ModelInfoSource(object):
+    """source of the hardware model info"""
+
+    # name of the source
+    name = None
+
+    def read(self):
+        """returns {'vendor': ..., 'product': ..., 'version': ...}, raises an exception on failure"""
+        raise NotImplementedError()
+
+class SysfsModelInfo(ModelInfoSource):
+    """model info from the DMI attributes in sysfs, readable without root"""
+
+    name = 'sysfs'
+
+    def __init__(self, dmi_dir=DMI_dir):
+        self.dmi_dir = dmi_dir
+
+    def read_attribute(self, attribute):
+        attribute_file = open(os.path.join(self.dmi_dir, attribute), 'r')
+        try:
+            return attribute_file.read().strip()
+        finally:
+            attribute_file.close()
+
+    def read(self):
+        return {'vendor': self.read_attribute('sys_vendor'),
+                'product': self.read_attribute('product_name'),
+                'version': self.read_attribute('product_version') }
+
+class DmidecodeModelInfo(ModelInfoSource):
+    """model info from the dmidecode module"""
+
+    name = 'dmidecode'
+
+    def read(self):
+        import dmidecode
+        current_system = dmidecode.system()
+        data = current_system['0x0001']['data']
+        return {'vendor': data['Manufacturer'],
+                'product': data['Product Name'],
+                'version': data['Version'] }
+
+class StaticModelInfo(ModelInfoSource):
+    """fixed model info, used when there is no real hardware"""
+
+    name = 'static'
+
+    def __init__(self, vendor, product, version):
+        self.info = {'vendor': vendor,
+                     'product': product,
+                     'version': version }
+
+    def read(self):
+        return dict(self.info)
+
+class FallbackModelInfo(ModelInfoSource):
+    """tries a list of sources in order and keeps the first result,
+       the model does not change while the daemon runs"""
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.name = ', '.join([source.name for source in sources])
+        self.info = None
+
+    def read(self):
+        if self.info is None:
+            error = None
+            for source in self.sources:
+                try:
+                    info = source.read()
+                except Exception, ex:
+                    error = ex
+                    continue
+                if info['vendor'] or info['product']:
+                    self.info = info
+                    self.name = source.name
+                    break
+                error = ValueError('empty model info from ' + source.name)
+            if self.info is None:
+                raise error or ValueError('no model info source')
+        return dict(self.info)
+
+def get_default_source():
+    """returns the model info source used by the daemon, the dmidecode module
+       is only loaded if sysfs has no DMI attributes"""
+    return FallbackModelInfo([SysfsModelInfo(), DmidecodeModelInfo()])
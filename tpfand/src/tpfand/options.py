@@ -0,0 +1,141 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+# files that may set an option: the config file, or the profiles and the config
+# file if the profile is overridden
+CONFIG = 1
+PROFILE = 2
+
+class Option(object):
+    """a scalar setting with its type, default, limits and the files that may set it"""
+
+    def __init__(self, name, type, default, limits=None, layer=CONFIG, description=None):
+        self.name = name
+        # bool or int
+        self.type = type
+        self.default = default
+        # (min, max) or None
+        self.limits = limits
+        self.layer = layer
+        if description is None and type is bool:
+            description = 'True / False'
+        self.description = description
+
+    def parse(self, value):
+        """converts a value read from a file, raises ValueError"""
+        if self.type is bool:
+            return value == 'True'
+        return self.type(value)
+
+    def format(self, value):
+        """converts a value for writing it to a file"""
+        return str(value)
+
+    def from_dbus(self, value):
+        """converts a value received through d-bus, raises ValueError"""
+        return self.type(value)
+
+    def to_dbus(self, value):
+        """converts a value for sending it through d-bus"""
+        if self.type is bool:
+            return int(value)
+        return value
+
+    def may_read(self, is_config, override_profile):
+        """returns True if a file of the given kind may set the option"""
+        if self.layer == CONFIG:
+            return is_config
+        return not is_config or override_profile
+
+class Schema(object):
+    """all options of the settings, the clamping pass is compiled once"""
+
+    def __init__(self, options):
+        self.options = options
+        self.by_name = dict((option.name, option) for option in options)
+        self.limited = [(option.name, option.limits[0], option.limits[1])
+                        for option in options if option.limits is not None]
+
+    def get(self, name):
+        """returns the option or None"""
+        return self.by_name.get(name)
+
+    def get_layer(self, layer):
+        """returns the options set by the given layer, in schema order"""
+        return [option for option in self.options if option.layer == layer]
+
+    def reset(self, settings, layer):
+        """sets the options of a layer to their defaults"""
+        for option in self.options:
+            if option.layer == layer:
+                setattr(settings, option.name, option.default)
+
+    def clamp(self, settings):
+        """limits all options to their range"""
+        for name, lmin, lmax in self.limited:
+            value = getattr(settings, name)
+            if value < lmin:
+                setattr(settings, name, lmin)
+            elif value > lmax:
+                setattr(settings, name, lmax)
+
+# options in the order they are written to the config file
+SCHEMA = Schema([
+    Option('enabled', bool, False),
+    Option('override_profile', bool, False),
+    # -1 if no profile sets it, clamped to 0
+    Option('hysteresis', int, -1, limits=(0, 10), layer=PROFILE,
+           description='hysteresis temperature difference'),
+    Option('adaptive_polling', bool, True),
+    Option('poll_min_time', int, 500, limits=(250, 60000),
+           description='shortest poll interval in msec'),
+    # may exceed the fan watchdog, the keepalive rearms it between the polls
+    Option('poll_max_time', int, 10000, limits=(250, 60000),
+           description='longest poll interval in msec'),
+    Option('event_driven', bool, False),
+    Option('telemetry_log', bool, False),
+    Option('pid_control', bool, False),
+    Option('pid_setpoint', int, 65, limits=(30, 100),
+           description='temperature held by the PID controller in degrees Celsius'),
+    Option('pid_proportional', int, 20, limits=(0, 1000),
+           description='proportional gain in 1/100 fan levels per K'),
+    Option('pid_integral', int, 5, limits=(0, 1000),
+           description='integral gain in 1/1000 fan levels per K and second'),
+    Option('pid_derivative', int, 0, limits=(0, 1000),
+           description='derivative gain in 1/100 fan levels per K/s'),
+    Option('predictive_control', bool, False),
+    Option('predictive_limit', int, 70, limits=(30, 100),
+           description='fallback temperature limit of the predictive controller in degrees Celsius'),
+    Option('predictive_horizon', int, 15, limits=(5, 300),
+           description='prediction horizon in seconds'),
+    Option('level_dwell_time', int, 0, limits=(0, 600),
+           description='minimum time in seconds a fan level is kept, 0 to disable'),
+    Option('level_max_steps', int, 0, limits=(0, 7),
+           description='maximum number of fan level steps per level_step_interval, 0 to disable'),
+    Option('level_step_interval', int, 10, limits=(1, 600),
+           description='interval in seconds for level_max_steps'),
+    Option('critical_temperature', int, 90, limits=(40, 127),
+           description='temperature in degrees Celsius that changes the fan level at once'),
+])
@@ -0,0 +1,111 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+from tpfand import triggers
+
+# highest normal fan level
+MAX_LEVEL = 7
+
+def level_to_speed(level):
+    """returns the fan speed for a fan level 0-7"""
+    if level <= 0:
+        return 0
+    return level + 1
+
+class PIDController(object):
+    """holds the hottest sensor at a temperature setpoint with a PID controller per sensor,
+       the integral only grows while the output is not saturated (anti-windup) and the
+       output is quantized to the fan levels with a small hysteresis"""
+
+    # the output must pass the middle between two levels by this much to change the level
+    output_hysteresis = 0.3
+    # no integration within this many K around the setpoint, so the controller settles at
+    # a level that holds the temperature close to the setpoint instead of alternating
+    # between the two levels around the exact cooling demand
+    deadband = 2
+
+    def __init__(self, setpoint=65, proportional=0.2, integral=0.005, derivative=0.0):
+        self.setpoint = setpoint
+        # gains in fan levels per K, per K and second, per K/s
+        self.proportional = proportional
+        self.integral = integral
+        self.derivative = derivative
+        self.reset()
+
+    def reset(self):
+        """forgets the controller state"""
+        # integral term and last reading per sensor
+        self.integrals = [ ]
+        self.last_temps = [ ]
+        self.last_time = None
+        self.level = 0
+        self.output = 0.0
+
+    def set_parameters(self, setpoint, proportional, integral, derivative):
+        """changes setpoint and gains, keeps the state"""
+        self.setpoint = setpoint
+        self.proportional = proportional
+        self.integral = integral
+        self.derivative = derivative
+
+    def decide(self, temps, now):
+        """returns the fan speed (0, 2-8) for the readings taken at time now"""
+        count = len(temps)
+        if len(self.integrals) != count:
+            self.integrals = (self.integrals + [0.0] * count)[:count]
+            self.last_temps = (self.last_temps + [None] * count)[:count]
+        dt = 0.0
+        if self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+        self.last_time = now
+
+        output = 0.0
+        for id in xrange(0, count):
+            temp = temps[id]
+            if not triggers.is_connected(temp):
+                self.last_temps[id] = None
+                continue
+            error = temp - self.setpoint
+            rate = 0.0
+            last = self.last_temps[id]
+            if last is not None and dt > 0:
+                rate = (temp - last) / dt
+            self.last_temps[id] = temp
+            integral = self.integrals[id]
+            step = 0.0
+            if abs(error) > self.deadband:
+                step = self.integral * error * dt
+            unclamped = self.proportional * error + integral + step + self.derivative * rate
+            # anti-windup: don't integrate further into saturation
+            if (step > 0 and unclamped < MAX_LEVEL) or (step < 0 and unclamped > 0):
+                integral += step
+            integral = min(max(integral, 0.0), float(MAX_LEVEL))
+            self.integrals[id] = integral
+            output = max(output, self.proportional * error + integral + self.derivative * rate)
+
+        self.output = output
+        if abs(output - self.level) > 0.5 + self.output_hysteresis:
+            self.level = int(min(max(round(output), 0), MAX_LEVEL))
+        return level_to_speed(self.level)
@@ -0,0 +1,144 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import time, bisect, thread
+from array import array
+
+# upper bounds of the histogram buckets in seconds, the last bucket takes everything slower
+BUCKETS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005,
+           0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+# phases of a poll, 'timer delay' is how late GLib called the poll and 'poll' the whole tick
+PHASES = ('timer delay', 'fan read', 'thermal read', 'decision', 'level write', 'watchdog write', 'poll')
+
+# clock used for the measurements
+timer = time.time
+
+class Histogram(object):
+    """counts durations in the fixed BUCKETS, adding a sample allocates nothing"""
+
+    def __init__(self):
+        self.counts = array('L', [0]) * (len(BUCKETS) + 1)
+        self.reset()
+
+    def reset(self):
+        """forgets all samples"""
+        for n in xrange(0, len(self.counts)):
+            self.counts[n] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        """adds a duration"""
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get_percentile(self, fraction):
+        """returns the upper bound of the bucket that contains the given fraction
+           of the samples, the maximum for the last bucket"""
+        wanted = fraction * self.count
+        seen = 0
+        for n in xrange(0, len(BUCKETS)):
+            seen += self.counts[n]
+            if seen >= wanted:
+                return min(BUCKETS[n], self.max)
+        return self.max
+
+class PollStats(object):
+    """duration histograms of the poll phases, the watchdog keepalive adds
+       its writes from a thread of its own"""
+
+    def __init__(self):
+        self.lock = thread.allocate_lock()
+        self.histograms = dict((phase, Histogram()) for phase in PHASES)
+        # number of the current poll and the number of the poll each phase was last added in
+        self.polls = 0
+        self.added_in = dict((phase, -1) for phase in PHASES)
+
+    def start_poll(self):
+        """called at the start of every poll"""
+        self.polls += 1
+
+    def reset(self):
+        """forgets all samples"""
+        self.lock.acquire()
+        try:
+            for histogram in self.histograms.values():
+                histogram.reset()
+        finally:
+            self.lock.release()
+
+    def add(self, phase, seconds):
+        """adds a duration of phase"""
+        self.lock.acquire()
+        try:
+            self.histograms[phase].add(seconds)
+            self.added_in[phase] = self.polls
+        finally:
+            self.lock.release()
+
+    def timed(self, phase, function):
+        """returns function wrapped so that every call is added to phase"""
+        def timed_function(*args):
+            start = timer()
+            try:
+                return function(*args)
+            finally:
+                self.add(phase, timer() - start)
+        return timed_function
+
+    def get_stats(self):
+        """returns [(phase, count, total seconds, max seconds, bucket counts), ...]"""
+        self.lock.acquire()
+        try:
+            return [(phase, self.histograms[phase].count, self.histograms[phase].total,
+                     self.histograms[phase].max, list(self.histograms[phase].counts))
+                    for phase in PHASES]
+        finally:
+            self.lock.release()
+
+    def format_last(self):
+        """returns the durations of the phases of the current poll as one line"""
+        return ', '.join(['%s %.2f ms' % (phase, self.histograms[phase].last * 1000)
+                          for phase in PHASES if self.added_in[phase] == self.polls])
+
+    def format(self):
+        """returns a table of the durations of all phases"""
+        lines = ['%-16s %8s %10s %10s %10s %10s' % ('phase', 'count', 'mean ms', 'p50 ms', 'p99 ms', 'max ms')]
+        for phase in PHASES:
+            histogram = self.histograms[phase]
+            if histogram.count == 0:
+                continue
+            lines.append('%-16s %8d %10.3f %10.3f %10.3f %10.3f' %
+                         (phase, histogram.count, histogram.total * 1000 / histogram.count,
+                          histogram.get_percentile(0.5) * 1000, histogram.get_percentile(0.99) * 1000,
+                          histogram.max * 1000))
+        return '\n'.join(lines)
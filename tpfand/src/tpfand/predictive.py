@@ -0,0 +1,192 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import math
+
+from tpfand import devices, triggers, pid
+
+def speed_to_level(speed):
+    """returns the fan level 0-8 (8 is full-speed) of an observed fan speed,
+       None if the EC decides the level"""
+    if speed in (devices.SPEED_OFF, 1):
+        return 0
+    if 2 <= speed <= 8:
+        return speed - 1
+    if speed == devices.SPEED_FULL:
+        return pid.MAX_LEVEL + 1
+    return None
+
+def get_sensor_limits(trigger_points):
+    """returns {sensor id: temperature} of the lowest trigger point that demands the highest
+       fan level of each sensor, sensors that only turn the fan off or hand it to the EC have none"""
+    limits = { }
+    for id, points in trigger_points.items():
+        highest = None
+        for temp, level in sorted(points.items()):
+            if level in (devices.SPEED_OFF, 1, devices.SPEED_AUTO):
+                continue
+            if highest is None or level > highest[1]:
+                highest = (temp, level)
+        if highest is not None:
+            limits[id] = highest[0]
+    return limits
+
+class SensorModel(object):
+    """first order thermal model of one sensor, dT/dt = c + a * T + b * level,
+       identified online with recursive least squares"""
+
+    # weight of older samples per update, so the model follows changes of the workload
+    forgetting = 0.98
+    # the covariance is not inflated further once its trace exceeds this
+    max_trace = 1e4
+    # time constant in seconds of the disturbance estimate
+    disturbance_time = 20.0
+
+    def __init__(self):
+        self.theta = [0.0, 0.0, 0.0]
+        self.covariance = [[1000.0, 0.0, 0.0], [0.0, 1000.0, 0.0], [0.0, 0.0, 1000.0]]
+        self.samples = 0
+        # recent rate of change the model does not explain, mostly changes of the workload
+        self.disturbance = 0.0
+
+    def update(self, temp, level, rate, dt):
+        """adds the observation that the temperature changed by rate K/s at temp
+           while the fan ran at level during the dt seconds between the readings"""
+        x = [1.0, float(temp), float(level)]
+        p = self.covariance
+        px = [sum([p[i][j] * x[j] for j in xrange(0, 3)]) for i in xrange(0, 3)]
+        trace = p[0][0] + p[1][1] + p[2][2]
+        forgetting = self.forgetting if trace < self.max_trace else 1.0
+        denominator = forgetting + sum([x[i] * px[i] for i in xrange(0, 3)])
+        gain = [px[i] / denominator for i in xrange(0, 3)]
+        error = rate - sum([self.theta[i] * x[i] for i in xrange(0, 3)])
+        self.theta = [self.theta[i] + gain[i] * error for i in xrange(0, 3)]
+        # what is left after the update is not explained by the model
+        error = rate - sum([self.theta[i] * x[i] for i in xrange(0, 3)])
+        self.disturbance += (1.0 - math.exp(-dt / self.disturbance_time)) * (error - self.disturbance)
+        # P = (P - k x^T P) / forgetting, P stays symmetric
+        self.covariance = [[(p[i][j] - gain[i] * px[j]) / forgetting for j in xrange(0, 3)]
+                           for i in xrange(0, 3)]
+        self.samples += 1
+
+    def predict(self, temp, level, horizon):
+        """returns the temperature after horizon seconds at the given fan level,
+           the fan may only cool and a model that does not relax is extrapolated linearly"""
+        c, a, b = self.theta
+        drive = c + self.disturbance + min(b, 0.0) * level
+        if a > -1e-6:
+            return temp + (drive + a * temp) * horizon
+        steady = -drive / a
+        return steady + (temp - steady) * math.exp(a * horizon)
+
+class PredictiveController(object):
+    """chooses the lowest fan level that keeps every sensor below its temperature limit
+       over the prediction horizon, based on a thermal model per sensor"""
+
+    # observations needed before a sensor model is used
+    min_samples = 10
+    # polls further apart are not used for identification (suspend, stalls)
+    max_gap = 60.0
+    # a lower level must keep the prediction this many K below the limit
+    level_hysteresis = 3.0
+
+    def __init__(self, limit=70, horizon=15, sensor_limits=None):
+        # limit of the sensors that have none in sensor_limits
+        self.limit = limit
+        self.horizon = horizon
+        self.sensor_limits = sensor_limits or { }
+        self.reset()
+
+    def reset(self):
+        """forgets the models and the controller state"""
+        self.models = [ ]
+        self.last_temps = [ ]
+        self.last_time = None
+        self.level = 0
+
+    def set_parameters(self, limit, horizon, sensor_limits=None):
+        """changes the limits and the horizon, keeps the models"""
+        self.limit = limit
+        self.horizon = horizon
+        self.sensor_limits = sensor_limits or { }
+
+    def is_identified(self):
+        """returns True if the models of all connected sensors are ready"""
+        return all([model.samples >= self.min_samples
+                    for model, temp in zip(self.models, self.last_temps) if temp is not None])
+
+    def identify(self, temps, level, now):
+        """updates the models with the readings taken at time now, level is the fan level
+           that was in effect since the last readings or None if the EC set it"""
+        count = len(temps)
+        if len(self.models) != count:
+            self.models = (self.models + [SensorModel() for n in xrange(len(self.models), count)])[:count]
+            self.last_temps = (self.last_temps + [None] * count)[:count]
+        dt = 0.0
+        if self.last_time is not None:
+            dt = now - self.last_time
+        usable = 0 < dt <= self.max_gap and level is not None
+        for id in xrange(0, count):
+            temp = temps[id]
+            if not triggers.is_connected(temp):
+                self.last_temps[id] = None
+                continue
+            last = self.last_temps[id]
+            if usable and last is not None:
+                self.models[id].update(last, level, (temp - last) / dt, dt)
+            self.last_temps[id] = temp
+        self.last_time = now
+
+    def decide(self, temps, speed, now):
+        """returns the fan speed (0, 2-8) for the readings taken at time now, speed is the
+           fan speed observed since the last readings, None until the models are identified"""
+        self.identify(temps, speed_to_level(speed), now)
+        if not self.is_identified():
+            return None
+        new_level = pid.MAX_LEVEL
+        for candidate in xrange(0, pid.MAX_LEVEL + 1):
+            margin = 0.0
+            if candidate < self.level:
+                margin = self.level_hysteresis
+            if self.get_margin(candidate) >= margin:
+                new_level = candidate
+                break
+        self.level = new_level
+        return pid.level_to_speed(new_level)
+
+    def get_margin(self, level):
+        """returns how far the temperatures predicted at the end of the horizon stay below
+           the limits of their sensors, negative if a sensor exceeds its limit"""
+        margin = None
+        for id in xrange(0, len(self.models)):
+            temp = self.last_temps[id]
+            if temp is not None:
+                predicted = self.models[id].predict(temp, level, self.horizon)
+                sensor_margin = self.sensor_limits.get(id, self.limit) - predicted
+                if margin is None or sensor_margin < margin:
+                    margin = sensor_margin
+        if margin is None:
+            return float(triggers.TEMP_MAX - triggers.TEMP_MIN)
+        return margin
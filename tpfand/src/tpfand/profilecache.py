@@ -0,0 +1,166 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, marshal
+
+from tpfand import virtual
+
+# version of the on-disk cache format, bump when the entries change
+CACHE_VERSION = 3
+
+def parse_profile(lines):
+    """parses the lines of a profile or config file in one pass,
+       returns (entries, errors) with the entries in file order:
+       ('sensor', line number, id, name, {temp: level} or None),
+       ('virtual', line number, id, (function, sensor ids, parameters)) before
+       the sensor entry of a virtual sensor,
+       ('option', line number, option, value as string) and
+       ('section', line number, name) for '[name]' lines,
+       errors is a list of (line number, message)"""
+    entries = [ ]
+    errors = [ ]
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        hash_pos = line.find('#')
+        if hash_pos >= 0:
+            line = line[:hash_pos]
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            entries.append(('section', lineno, line[1:-1].strip()))
+            continue
+        dot = line.find('.')
+        equals = line.find('=')
+        try:
+            if dot >= 0 and (equals < 0 or dot < equals):
+                entries.extend(parse_sensor_line(line, dot, equals, lineno))
+            elif equals >= 0:
+                entries.append(('option', lineno, line[:equals].strip(), line[equals + 1:].strip()))
+            else:
+                errors.append((lineno, 'neither an option nor a sensor: ' + line))
+        except ValueError, ex:
+            errors.append((lineno, str(ex)))
+    return entries, errors
+
+def parse_sensor_line(line, dot, equals, lineno):
+    """parses 'id. name = [function(arg, ...)] temp:level temp:level ...' into a list of entries,
+       the expression of a virtual sensor and the trigger points are optional"""
+    try:
+        id = int(line[:dot])
+    except ValueError:
+        raise ValueError('invalid sensor id: ' + line[:dot].strip())
+    if equals < 0:
+        return [('sensor', lineno, id, line[dot + 1:].strip(), None)]
+    entries = [ ]
+    value = line[equals + 1:]
+    close = value.rfind(')')
+    if close >= 0:
+        entries.append(('virtual', lineno, id, virtual.parse_expression(value[:close + 1])))
+        value = value[close + 1:]
+    points = { }
+    for trigger in value.split():
+        fields = trigger.split(':')
+        if len(fields) != 2:
+            raise ValueError('invalid trigger point: ' + trigger)
+        try:
+            points[int(fields[0])] = int(fields[1])
+        except ValueError:
+            raise ValueError('invalid trigger point: ' + trigger)
+    entries.append(('sensor', lineno, id, line[dot + 1:equals].strip(), points))
+    return entries
+
+def get_identity(path):
+    """returns what identifies the contents of a file for the cache"""
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime)
+
+class ProfileCache(object):
+    """parsed profiles keyed on path, inode, size and mtime, optionally kept on disk
+       so an unchanged profile is only parsed once"""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        # path -> (identity, entries, errors)
+        self.profiles = { }
+        self.loaded = cache_path is None
+        self.dirty = False
+
+    def get(self, path):
+        """returns (entries, errors) of the profile at path,
+           raises IOError/OSError if it can't be read"""
+        if not self.loaded:
+            self.load()
+        identity = get_identity(path)
+        cached = self.profiles.get(path)
+        if cached is not None and cached[0] == identity:
+            return cached[1], cached[2]
+        profile_file = open(path, 'r')
+        try:
+            entries, errors = parse_profile(profile_file)
+        finally:
+            profile_file.close()
+        self.profiles[path] = (identity, entries, errors)
+        self.dirty = True
+        return entries, errors
+
+    def invalidate(self, path):
+        """forgets the profile at path, for files changed within the mtime resolution"""
+        if self.profiles.pop(path, None) is not None:
+            self.dirty = True
+
+    def load(self):
+        """reads the on-disk cache, a missing or broken cache is ignored"""
+        self.loaded = True
+        try:
+            cache_file = open(self.cache_path, 'rb')
+            try:
+                version, profiles = marshal.load(cache_file)
+            finally:
+                cache_file.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return
+        if version == CACHE_VERSION and isinstance(profiles, dict):
+            self.profiles.update(profiles)
+
+    def save(self):
+        """writes the on-disk cache if something was parsed since the last save"""
+        if self.cache_path is None or not self.dirty:
+            return
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp_path = self.cache_path + '.tmp'
+            cache_file = open(temp_path, 'wb')
+            try:
+                marshal.dump((CACHE_VERSION, self.profiles), cache_file)
+            finally:
+                cache_file.close()
+            os.rename(temp_path, self.cache_path)
+            self.dirty = False
+        except (IOError, OSError), ex:
+            print 'Warning: unable to write the profile cache: ', ex
@@ -0,0 +1,124 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path
+
+# name of the index file in the models directory, written by the tpfand-profiles Makefile
+INDEX_NAME = 'index'
+
+# directories listed in the index, relative to the models directory
+INDEXED_DIRS = ['by-id', 'by-name']
+
+class ProfileIndex(object):
+    """set of the profile files below models/, used instead of probing
+       the file system for every possible profile name"""
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        self.path = os.path.join(model_dir, INDEX_NAME)
+        # (mtime, size) of the loaded index and its entries
+        self.stamp = None
+        self.entries = frozenset()
+        # directory -> mtime at which its listing matched the index
+        self.verified = { }
+
+    def is_current(self):
+        """loads the index if it changed, returns False if it is missing or
+           does not list the files of one of the indexed directories"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        stamp = (st.st_mtime, st.st_size)
+        if stamp != self.stamp:
+            try:
+                self.entries = read_index(self.path)
+            except IOError:
+                return False
+            self.stamp = stamp
+            self.verified = { }
+        for name in INDEXED_DIRS:
+            try:
+                mtime = os.stat(os.path.join(self.model_dir, name)).st_mtime
+            except OSError:
+                # a directory that does not exist has no new profiles
+                continue
+            # package managers give the directories the install time and the index
+            # its build time, so a newer directory is compared with the index
+            if mtime > st.st_mtime and self.verified.get(name) != mtime:
+                if not self.lists_directory(name):
+                    return False
+                self.verified[name] = mtime
+        return True
+
+    def lists_directory(self, name):
+        """returns True if the index lists exactly the files of the given directory"""
+        try:
+            files = os.listdir(os.path.join(self.model_dir, name))
+        except OSError:
+            return False
+        prefix = name + '/'
+        listed = [entry for entry in self.entries if entry.startswith(prefix)]
+        return len(listed) == len(files) and \
+            all([prefix + file_name in self.entries for file_name in files])
+
+    def find(self, product_name, product_id):
+        """returns the matching by-name prefix profiles and the by-id profile
+           (or None), as paths relative to the models directory"""
+        name_path = 'by-name/' + product_name
+        entries = self.entries
+        names = [ ]
+        for n in range(len('by-name/') + 1, len(name_path)):
+            if name_path[0:n] in entries:
+                names.append(name_path[0:n])
+        id_path = 'by-id/' + product_id
+        if id_path not in entries:
+            id_path = None
+        return names, id_path
+
+def read_index(path):
+    """returns the set of profile paths listed in an index file"""
+    index_file = open(path, 'r')
+    try:
+        entries = set()
+        for line in index_file:
+            line = line.strip()
+            if len(line) > 0 and not line.startswith('#'):
+                entries.add(line)
+        return frozenset(entries)
+    finally:
+        index_file.close()
+
+def scan(model_dir, product_name, product_id):
+    """find() without an index, checks every candidate file"""
+    name_path = 'by-name/' + product_name
+    names = [ ]
+    for n in range(len('by-name/') + 1, len(name_path)):
+        if os.path.isfile(model_dir + name_path[0:n]):
+            names.append(name_path[0:n])
+    id_path = 'by-id/' + product_id
+    if not os.path.isfile(model_dir + id_path):
+        id_path = None
+    return names, id_path
@@ -0,0 +1,81 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+from tpfand import triggers
+
+class AdaptiveScheduler(object):
+    """chooses the next poll interval from the rate of change of the temperatures"""
+
+    # weight of the newest sample in the rate estimate
+    smoothing = 0.5
+    # number of polls that should happen before a climbing sensor reaches its next trigger point
+    polls_before_trigger = 2.0
+
+    def __init__(self):
+        self.last_time = None
+        self.last_temps = None
+        # estimated temperature change per sensor in K/s
+        self.rates = [ ]
+
+    def reset(self):
+        """forgets all previous readings"""
+        self.last_time = None
+        self.last_temps = None
+        self.rates = [ ]
+
+    def update(self, now, temps):
+        """updates the rate estimates with new readings taken at time now (in s)"""
+        if len(self.rates) != len(temps):
+            self.rates = [0.0] * len(temps)
+        elif self.last_time is not None and now > self.last_time:
+            dt = now - self.last_time
+            rates = self.rates
+            last_temps = self.last_temps
+            for id in xrange(0, len(temps)):
+                if triggers.is_connected(temps[id]) and triggers.is_connected(last_temps[id]):
+                    rate = (temps[id] - last_temps[id]) / dt
+                    rates[id] += self.smoothing * (rate - rates[id])
+                else:
+                    rates[id] = 0.0
+        self.last_time = now
+        self.last_temps = temps
+
+    def next_interval(self, tables, min_interval, max_interval):
+        """returns the next poll interval in ms, short if a sensor climbs towards
+           its next trigger point and max_interval if all temperatures are stable"""
+        interval = float(max_interval)
+        if self.last_temps is None or tables is None:
+            return int(interval)
+        for id in xrange(0, min(len(self.rates), tables.get_sensor_count())):
+            rate = self.rates[id]
+            if rate <= 0:
+                continue
+            temp = self.last_temps[id]
+            trigger = tables.next_trigger(id, temp)
+            if trigger is None:
+                continue
+            time_to_trigger = (trigger - temp) * 1000.0 / rate
+            interval = min(interval, time_to_trigger / self.polls_before_trigger)
+        return int(max(min_interval, min(max_interval, interval)))
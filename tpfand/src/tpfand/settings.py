@@ -27,9 +27,8 @@ if not ('/usr/share/pyshared' in sys.path):
 import sys, os, os.path
 import dbus, dbus.service, dbus.mainloop.glib, dbus.glib
 import gobject
-import dmidecode
 
-from tpfand import build
+from tpfand import build, devices, triggers, virtual, options, modelinfo, profileindex, profilecache, startup, inotify
 
 class ProfileNotOverriddenException(dbus.DBusException):
     _dbus_error_name = "org.thinkpad.fancontrol.ProfileNotOverriddenException"
@@ -37,14 +36,38 @@ class ProfileNotOverriddenException(dbus.DBusException):
 class Settings(dbus.service.Object):
     """profile and config settings"""
     
-    # user options
-    enabled = False    
-    override_profile = False
+    # user options and profile / user overrideable options are declared in options.SCHEMA
     
-    # profile / user overrideable options
+    # profile / user overrideable sensor settings
     sensor_names = { }
     trigger_points = { }
-    hysteresis = -1
+    
+    # trigger points of the [fanN] sections for the fans other than fan 1,
+    # fans without a section use trigger_points
+    fan_trigger_points = { }
+    
+    # expressions of the virtual sensors by id, their ids follow the physical sensors
+    virtual_sensors = { }
+    
+    # trigger points compiled for the fan controller, fan_trigger_tables by fan id
+    trigger_tables = None
+    fan_trigger_tables = { }
+    
+    # virtual sensors compiled for the fan controller
+    virtual_plan = None
+    
+    # index of the installed profiles
+    profile_index = None
+    
+    # parsed profile and config files
+    profile_cache = None
+    
+    # msecs between the first unsaved change and writing the config file
+    save_delay = 2000
+    
+    # msecs between a change of the config file or the profiles and reloading them,
+    # editors and package managers change several files at once
+    reload_delay = 500
     
     # hardware product info    
     product_name = None
@@ -59,10 +82,33 @@ class Settings(dbus.service.Object):
     # comments for the last loaded profile
     profile_comment = ""
 
-    def __init__(self, bus, path):
+    def __init__(self, bus, path, model_info=None, config_path=build.config_path, data_dir=build.data_dir,
+                 profile_cache=None):
         dbus.service.Object.__init__(self, bus, path)
+        options.SCHEMA.reset(self, options.CONFIG)
+        options.SCHEMA.reset(self, options.PROFILE)
+        # where the model info, the config file and the profiles come from
+        self.model_info = model_info or modelinfo.get_default_source()
+        self.config_path = config_path
+        self.data_dir = data_dir
+        self.profile_cache = profile_cache or profilecache.ProfileCache()
+        # filled in place by read_config, must not be shared between instances
+        self.fan_trigger_points = { }
+        self.virtual_sensors = { }
+        # the config file has unsaved changes, pending timer that writes it
+        self.dirty = False
+        self.save_timer = None
+        # identity of the config file last written by us
+        self.written_identity = None
+        # watches the config file and the profiles, layers to reload and pending reload timer
+        self.watcher = None
+        self.config_changed = False
+        self.profiles_changed = False
+        self.reload_timer = None
         self.read_model_info()
+        startup.timer.mark('model info')
         self.load()
+        startup.timer.mark('settings')
         
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='a{ss}') 
     def get_model_info(self):
@@ -94,21 +140,30 @@ class Settings(dbus.service.Object):
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='')
     def load(self):
         """loads profile and config form disk"""
-        self.enabled = False    
-        self.override_profile = False
-        if os.path.isfile(build.config_path):
-            self.read_config(build.config_path, True)
+        self.flush()
+        options.SCHEMA.reset(self, options.CONFIG)
+        # read_config merges, entries removed from the file must not survive a reload
+        self.reset_profile_layer()
+        if os.path.isfile(self.config_path):
+            self.read_config(self.config_path, True)
         self.load_profile()
+        self.profile_cache.save()
         self.verify()
                 
+    def reset_profile_layer(self):
+        """forgets the sensors, trigger points and profile options"""
+        self.sensor_names = { }
+        self.trigger_points = { }
+        self.fan_trigger_points = { }
+        self.virtual_sensors = { }
+        options.SCHEMA.reset(self, options.PROFILE)
+        self.profile_comment = ""
+
     def load_profile(self):
         """loads profile from disk"""
         profile_file_list, self.loaded_profiles, self.id_match = self.get_profile_file_list()
         if not self.override_profile:  
-            self.sensor_names = { }
-            self.trigger_points = { }
-            self.hysteresis = -1
-            self.profile_comment = ""
+            self.reset_profile_layer()
             for path in profile_file_list:
                 try:
                     # only show comment of profile that matches notebook model best
@@ -121,43 +176,115 @@ class Settings(dbus.service.Object):
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='') 
     def save(self):
         """saves config to disk"""
-        self.write_config(build.config_path)
+        self.dirty = True
+        self.flush()
+
+    def schedule_save(self):
+        """saves config to disk after save_delay, further changes until then are written
+           with the same save"""
+        self.dirty = True
+        if self.save_timer is None:
+            self.save_timer = gobject.timeout_add(self.save_delay, self.save_timeout)
+
+    def save_timeout(self):
+        """called by the save timer"""
+        self.save_timer = None
+        self.flush()
+        return False
+
+    def flush(self):
+        """writes pending changes of the config to disk now"""
+        if self.save_timer is not None:
+            gobject.source_remove(self.save_timer)
+            self.save_timer = None
+        if self.dirty:
+            try:
+                self.write_config(self.config_path)
+                self.dirty = False
+            except (IOError, OSError), ex:
+                print "Error saving ", self.config_path, ": ", ex
         
+    def start_watching(self):
+        """reloads the config file and the profiles when they are changed on disk,
+           returns False if inotify is not available"""
+        if self.watcher is None:
+            self.watcher = inotify.DirectoryWatcher(self.file_changed)
+        if not self.watcher.start():
+            return False
+        model_dir = self.data_dir + 'models/'
+        self.watcher.add_directory(os.path.dirname(self.config_path))
+        for path in [model_dir, model_dir + 'by-id', model_dir + 'by-name']:
+            self.watcher.add_directory(path)
+        return True
+
+    def file_changed(self, path):
+        """called by the watcher, path is None if changes were missed"""
+        if path is None or path == self.config_path:
+            # the config decides which profiles are used, so this reloads both
+            self.config_changed = True
+        elif path.startswith(self.data_dir + 'models/'):
+            self.profiles_changed = True
+        else:
+            return
+        if self.reload_timer is None:
+            self.reload_timer = gobject.timeout_add(self.reload_delay, self.reload)
+
+    def reload(self):
+        """reloads the changed layers, only unchanged files come from the profile cache"""
+        self.reload_timer = None
+        config_changed = self.config_changed
+        profiles_changed = self.profiles_changed
+        self.config_changed = False
+        self.profiles_changed = False
+        if config_changed and os.path.isfile(self.config_path):
+            try:
+                if profilecache.get_identity(self.config_path) == self.written_identity:
+                    # our own save
+                    config_changed = False
+            except OSError:
+                pass
+        if self.dirty:
+            # unsaved changes made through d-bus overwrite the config file anyway,
+            # changed profiles are still loaded
+            config_changed = False
+        if config_changed:
+            self.load()
+        elif profiles_changed and not self.override_profile:
+            # the profiles only matter if the config does not override them
+            self.load_profile()
+            self.profile_cache.save()
+            self.verify()
+        return False
+
     def get_profile_file_list(self):
         """returns a list of profile files to load for this system"""
-        model_dir = build.data_dir + 'models/'
-        product_id_dir = model_dir + 'by-id/'
-        product_name_dir = model_dir + 'by-name/'
-                
-        # generic profile
-        files = [model_dir + "generic"]
-        profiles = [ "generic" ]
-        
-        # match parts of product name
-        product_path = product_name_dir + self.product_name
-        for n in range(len(product_name_dir)+1, len(product_path)):
-            path = product_path[0:n]
-            if os.path.isfile(path):
-                files.append(path)
-                profiles.append(path[len(model_dir):])
-                
-        # try matching model id
-        id_match = False
-        model_path = product_id_dir + self.product_id
-        if os.path.isfile(model_path):
-            files.append(model_path)
-            profiles.append(model_path[len(model_dir):])
-            id_match = True
+        model_dir = self.data_dir + 'models/'
+        if self.profile_index is None or self.profile_index.model_dir != model_dir:
+            self.profile_index = profileindex.ProfileIndex(model_dir)
+
+        # match parts of product name and model id, only scan the directories
+        # if the index is missing or older than the installed profiles
+        if self.profile_index.is_current():
+            names, id_path = self.profile_index.find(self.product_name, self.product_id)
+        else:
+            names, id_path = profileindex.scan(model_dir, self.product_name, self.product_id)
+
+        # generic profile first
+        profiles = [ "generic" ] + names
+        id_match = id_path is not None
+        if id_match:
+            profiles.append(id_path)
+        files = [model_dir + profile for profile in profiles]
                         
         return files, profiles, id_match
         
     def read_model_info(self):
-        """reads model info using dmidecode module"""
+        """reads model info from the model info source"""
         try:
-            current_system = dmidecode.system()                   
-            hw_product = current_system['0x0001']['data']['Product Name']
-            hw_vendor = current_system['0x0001']['data']['Manufacturer']
-            hw_version = current_system['0x0001']['data']['Version']
+            info = self.model_info.read()
+            hw_product = info['product']
+            hw_vendor = info['vendor']
+            hw_version = info['version']
             product_id = hw_vendor + "_" + hw_product
             self.product_id = product_id.lower()
             product_name = hw_vendor.lower() + "_" + hw_version.lower()
@@ -167,7 +294,7 @@ class Settings(dbus.service.Object):
             self.product_pretty_name = hw_version
             self.product_pretty_id = hw_product
         except:
-            print "Warning: unable to get your system model from dmidecode"
+            print "Warning: unable to get your system model from " + self.model_info.name
             self.product_id = ''
             self.product_name = ''
             self.product_pretty_vendor = ''
@@ -185,7 +312,7 @@ class Settings(dbus.service.Object):
         self.verify_profile_overridden()
         self.sensor_names = set
         self.verify()
-        self.save()
+        self.schedule_save()
         
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='a{ia{ii}}')    
     def get_trigger_points(self):
@@ -198,27 +325,96 @@ class Settings(dbus.service.Object):
         self.verify_profile_overridden()
         self.trigger_points = set
         self.verify()
-        self.save()
+        self.schedule_save()
+        
+    @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='i', out_signature='a{ia{ii}}')
+    def get_fan_trigger_points(self, fan_id):
+        """returns the temperature trigger points of the given fan, an empty dict
+           if the fan uses the trigger points of fan 1"""
+        if fan_id == 1:
+            return self.trigger_points
+        return self.fan_trigger_points.get(fan_id, { })
+    
+    @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='ia{ia{ii}}', out_signature='')
+    def set_fan_trigger_points(self, fan_id, set):
+        """sets the temperature trigger points of the given fan, an empty dict
+           makes the fan use the trigger points of fan 1"""
+        self.verify_profile_overridden()
+        if fan_id == 1:
+            self.trigger_points = set
+        elif len(set) > 0:
+            self.fan_trigger_points[fan_id] = set
+        else:
+            self.fan_trigger_points.pop(fan_id, None)
+        self.verify()
+        self.schedule_save()
+        
+    @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='a{is}')
+    def get_virtual_sensors(self):
+        """returns the expressions of the virtual sensors"""
+        return dict((id, virtual.format_expression(expression))
+                    for id, expression in self.virtual_sensors.items())
+    
+    @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='a{is}', out_signature='')
+    def set_virtual_sensors(self, set):
+        """sets the expressions of the virtual sensors, raises ValueError if one is invalid"""
+        self.verify_profile_overridden()
+        virtual_sensors = { }
+        for id, text in set.items():
+            expression = virtual.parse_expression(text)
+            virtual.check_expression(id, expression)
+            virtual_sensors[id] = expression
+        self.virtual_sensors = virtual_sensors
+        self.verify()
+        self.schedule_save()
+        
+    def get_trigger_tables(self, fan_id):
+        """returns the compiled trigger points of the given fan"""
+        return self.fan_trigger_tables.get(fan_id, self.trigger_tables)
         
     def verify(self):
         """Verifies that all settings a valid"""
+        # physical sensors read by a virtual sensor are covered by it,
+        # virtual sensors without trigger points do not drive the fan
+        inputs = virtual.get_inputs(self.virtual_sensors)
         for n in range(0, self.get_sensor_count()):
+            if not self.is_sensor_used(n):
+                # every id below the sensor count has an entry, the unused ids
+                # between the physical and the virtual sensors are empty
+                self.sensor_names[n] = ""
+                self.trigger_points[n] = { }
+                continue
             if n not in self.sensor_names or len(self.sensor_names[n].strip()) == 0:
                 self.sensor_names[n] = "Sensor " + str(n)
             else:
                 self.sensor_names[n] = self.sensor_names[n].replace("=", "-").replace("\n", "")
-            if n not in self.trigger_points:
-                self.trigger_points[n] = {0: 255}
-        for opt in ['hysteresis']:
-            val = eval('self.' + opt)
-            lmin, lmax = self.get_setting_limits(opt)
-            if val < lmin or val > lmax:
-                if val < lmin:
-                    val = lmin
-                if val > lmax:
-                    val = lmax
-                exec 'self.' + opt + ' = ' + str(val)
+            if not self.trigger_points.get(n):
+                if n < devices.SENSOR_COUNT and n not in inputs:
+                    self.trigger_points[n] = {0: 255}
+                else:
+                    self.trigger_points[n] = { }
+        for n in self.sensor_names.keys():
+            if n >= self.get_sensor_count():
+                del self.sensor_names[n]
+                self.trigger_points.pop(n, None)
+        options.SCHEMA.clamp(self)
+        if self.poll_max_time < self.poll_min_time:
+            self.poll_max_time = self.poll_min_time
+        self.trigger_tables = triggers.TriggerTables(self.trigger_points, self.hysteresis,
+                                                     self.get_sensor_count(), self.trigger_tables)
+        # sensors missing from a fan section do not drive that fan
+        fan_trigger_tables = { }
+        for fan_id, points in self.fan_trigger_points.items():
+            fan_trigger_tables[fan_id] = triggers.TriggerTables(points, self.hysteresis,
+                                                                self.get_sensor_count(),
+                                                                self.fan_trigger_tables.get(fan_id))
+        self.fan_trigger_tables = fan_trigger_tables
+        self.virtual_plan = virtual.VirtualSensorPlan(self.virtual_sensors, previous=self.virtual_plan)
                 
+    def is_sensor_used(self, id):
+        """returns False for the unused ids between the physical and the virtual sensors"""
+        return id < devices.SENSOR_COUNT or id in self.virtual_sensors
+        
     def verify_profile_overridden(self):
         """verifies that override_profile is true, raises ProfileNotOverriddenException if it is not"""
         if not self.override_profile:
@@ -226,57 +422,78 @@ class Settings(dbus.service.Object):
                     
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='i')        
     def get_sensor_count(self):
-        """returns the count of sensors"""
-        return 16
+        """returns the count of sensors, virtual sensors follow the physical ones"""
+        return virtual.get_sensor_count(self.virtual_sensors)
     
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='s', out_signature='ad')
     def get_setting_limits(self, opt):
-        """returns the limits (min, max) of the given option"""
-        if opt == 'hysteresis':
-            return [0, 10]
-        else:
-            return None
+        """returns the limits (min, max) of the given option, an empty list if it has none"""
+        option = options.SCHEMA.get(opt)
+        if option is None or option.limits is None:
+            return [ ]
+        return list(option.limits)
     
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='a{si}')
     def get_settings(self):
         """returns the settings"""
-        ret = {'hysteresis': self.hysteresis,
-               'enabled': int(self.enabled),
-               'override_profile': int(self.override_profile)}       
+        ret = { }
+        for option in options.SCHEMA.options:
+            ret[option.name] = option.to_dbus(getattr(self, option.name))
         return ret
     
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='a{si}', out_signature='')        
     def set_settings(self, set):
         """sets the settings"""
         try:
-            if 'override_profile' in set:
-                self.override_profile = bool(set['override_profile'])   
-            if 'enabled' in set:
-                self.enabled = bool(set['enabled'])                        
-            if 'hysteresis' in set:
-                self.verify_profile_overridden()
-                self.hysteresis = set['hysteresis']           
+            # in schema order, override_profile comes before the profile options
+            for option in options.SCHEMA.options:
+                if option.name in set:
+                    if option.layer == options.PROFILE:
+                        self.verify_profile_overridden()
+                    setattr(self, option.name, option.from_dbus(set[option.name]))
         except ValueError, ex:
             print "Error parsing parameters: ", ex
             pass
         finally:
             self.verify()
-            self.save()
+            self.schedule_save()
             if not self.override_profile:
                 self.load_profile()
                 self.verify()
     
     def write_config(self, path):
-        """Writes a fan profile file"""
-        file = open(path, 'w')
+        """Writes a fan profile file, the file is replaced at once so readers never see
+           a partially written file"""
+        try:
+            mode = os.stat(path).st_mode & 07777
+        except OSError:
+            mode = 0644
+        temp_path = path + '.tmp'
+        file = os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode), 'w')
+        try:
+            self.write_config_file(file)
+            file.flush()
+            os.fsync(file.fileno())
+        except:
+            file.close()
+            os.remove(temp_path)
+            raise
+        file.close()
+        os.rename(temp_path, path)
+        self.profile_cache.invalidate(path)
+        if path == self.config_path:
+            self.written_identity = profilecache.get_identity(path)
+
+    def write_config_file(self, file):
+        """writes the config to an open file"""
         file.write("""#
 # tp-fancontrol configuration file
 #
 # Options:
-# enabled = [True / False]
-# override_profile = [True / False]
-# hysteresis = [hysteresis temperature difference]
-#
+""")
+        for option in options.SCHEMA.options:
+            file.write("# %s = [%s]\n" % (option.name, option.description))
+        file.write("""#
 # Trigger point syntax:
 # [sensor-id]. [human readable sensor name] = [temperature]:[fan level] ...
 # [fan level] = 0: fan off
@@ -284,96 +501,119 @@ class Settings(dbus.service.Object):
 # [fan level] = 255: hardware controlled cooling mode
 # default rule is used for all unspecified sensors
 #
+# Trigger points after a [fanN] line only apply to fan N, sensors not
+# listed there do not drive that fan. Fans without a section and fan 1
+# use the trigger points before the first section.
+#
+# Virtual sensor syntax:
+# [16-31]. [name] = [function]([sensor-id], ...) [temperature]:[fan level] ...
+# [function] = max, mean: hottest / mean reading of the listed sensors or
+#              of all physical sensors if none are listed
+# [function] = wsum: weighted sum, [sensor-id]*[weight], ...
+# [function] = ewma: [sensor-id], [time constant in seconds]
+# Physical sensors read by a virtual sensor do not use the default rule.
+#
 # override_profile = True has to be specified before profile parameters
 # or trigger points are changed in the configuration file.
 # tpfand may regenerate this file at any time. Custom comments will be lost.
 #
 
 """)
-        file.write("enabled = %s\n" % str(self.enabled))
-        file.write("override_profile = %s\n" % str(self.override_profile))
+        for option in options.SCHEMA.get_layer(options.CONFIG):
+            file.write("%s = %s\n" % (option.name, option.format(getattr(self, option.name))))
         file.write("\n")
                     
         if self.override_profile:
             file.write(self.get_profile_string())
-            
-        file.close()
     
     @dbus.service.method("org.thinkpad.fancontrol.Settings", in_signature='', out_signature='s')  
     def get_profile_string(self):
         """returns the current profile as a string"""
+        ids = [id for id in sorted(self.sensor_names.keys()) if self.is_sensor_used(id)]
+        res = self.get_sensor_lines(ids, self.trigger_points, self.virtual_sensors)
+        
+        res += '\n'
+        for option in options.SCHEMA.get_layer(options.PROFILE):
+            res += "%s = %s\n" % (option.name, option.format(getattr(self, option.name)))
+        for fan_id in sorted(self.fan_trigger_points.keys()):
+            points = self.fan_trigger_points[fan_id]
+            res += "\n[fan%d]\n" % fan_id
+            res += self.get_sensor_lines(sorted(points.keys()), points, { })
+        return res
+    
+    def get_sensor_lines(self, ids, trigger_points, virtual_sensors):
+        """returns the profile lines of the given sensors"""
         res = ""
-        ids = set(self.sensor_names.keys())
-        ids.union(set(self.trigger_points.keys()))
         for id in ids:
             if id in self.sensor_names:
                 name = self.sensor_names[id]
             else:
                 name = ""
             line = str(id) + ". " + name
-            if id in self.trigger_points:
+            if id in virtual_sensors:
+                line += " = " + virtual.format_expression(virtual_sensors[id]) + " "
+                for temp in sorted(trigger_points.get(id, { }).keys()):
+                    line += "%d:%d " % (temp, trigger_points[id][temp])
+            elif id in trigger_points:
                 line += " = "
-                points = self.trigger_points[id]
+                points = trigger_points[id]
                 temps = points.keys()
                 temps.sort()
                 for temp in temps:
                     level = points[temp]
                     line += "%d:%d " % (temp, level)
             res += line + '\n'
-        
-        res += '\n'
-        res += "hysteresis = %d\n" % self.hysteresis
         return res
     
     def read_config(self, path, is_config):
         """Reads a fan profile file"""
-        file = open(path, 'r')
-        for line in file.readlines():
-            line = line.split('#')[0].strip()
-            if len(line) > 0:
-                try:
-                    if (line.count('.') and line.count('=') and line.find('.') < line.find('=')) or (line.count('.') and not line.count('=')):
-                        if (is_config and self.override_profile) or (not is_config and not self.override_profile): 
-                            id, rest = line.split('.', 1)
-                            id = id.strip()
-                            id = int(id)
-                                
-                            if rest.count('='):
-                                name, triggers = rest.split('=', 1)
-                                name = name.strip()
-                                points = { }
-                                for trigger in triggers.strip().split(' '):
-                                    trigger = trigger.strip()
-                                    if len(trigger) > 0:
-                                        temp, level = trigger.split(':')
-                                        temp = int(temp)
-                                        points[temp] = int(level)
-                                if len(points) > 0:
-                                    self.trigger_points[id] = points                                                                                                                     
+        entries, errors = self.profile_cache.get(path)
+        for lineno, message in errors:
+            print "Error parsing %s line %d: %s" % (path, lineno, message)
+        # sensor lines before the first [fanN] section belong to fan 1
+        fan_id = 1
+        for entry in entries:
+            lineno = entry[1]
+            try:
+                if entry[0] == 'section':
+                    kind, lineno, name = entry
+                    fan_id = None
+                    if name.startswith('fan') and name[3:].isdigit() and int(name[3:]) > 0:
+                        fan_id = int(name[3:])
+                    else:
+                        raise ValueError('unknown section: ' + name)
+                elif entry[0] == 'virtual':
+                    if (is_config and self.override_profile) or (not is_config and not self.override_profile):
+                        kind, lineno, id, expression = entry
+                        virtual.check_expression(id, expression)
+                        self.virtual_sensors[id] = expression
+                elif entry[0] == 'sensor':
+                    if fan_id is None:
+                        # inside an unknown section
+                        continue
+                    if (is_config and self.override_profile) or (not is_config and not self.override_profile):
+                        kind, lineno, id, name, points = entry
+                        if points:
+                            # the cached entry must not be changed
+                            if fan_id == 1:
+                                self.trigger_points[id] = dict(points)
                             else:
-                                name = rest.strip()
-                                triggers = None
-                            if len(name) > 0:
-                                self.sensor_names[id] = name
-                            
-                    elif line.count('='):
-                        option, value = line.split('=', 1)
-                        option = option.strip()
-                        value = value.strip()
-                        if option == 'hysteresis' and ((is_config and self.override_profile) or not is_config):
-                            self.hysteresis = int(value)
-                        elif option == 'enabled' and is_config:
-                            self.enabled = (value == 'True')
-                        elif option == 'override_profile' and is_config:
-                            self.override_profile = (value == 'True')
-                        elif option == 'comment' and not is_config:
-                            self.profile_comment = value.replace("\\n", "\n")
-                            # verify that comment is valid unicode, otherwise use Latin1 coding
-                            try:
-                                unicode(self.profile_comment)
-                            except UnicodeDecodeError:
-                                self.profile_comment = self.profile_comment.decode("latin1")
-                except Exception, e:
-                    print "Error parsing line: %s" % line
-                    print e
-        file.close()        
+                                self.fan_trigger_points.setdefault(fan_id, { })[id] = dict(points)
+                        if len(name) > 0:
+                            self.sensor_names[id] = name
+                else:
+                    kind, lineno, name, value = entry
+                    option = options.SCHEMA.get(name)
+                    if option is not None:
+                        if option.may_read(is_config, self.override_profile):
+                            setattr(self, name, option.parse(value))
+                    elif name == 'comment' and not is_config:
+                        self.profile_comment = value.replace("\\n", "\n")
+                        # verify that comment is valid unicode, otherwise use Latin1 coding
+                        try:
+                            unicode(self.profile_comment)
+                        except UnicodeDecodeError:
+                            self.profile_comment = self.profile_comment.decode("latin1")
+            except ValueError, e:
+                print "Error parsing %s line %d: %s" % (path, lineno, e)
+       
@@ -0,0 +1,376 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path, heapq, tempfile, shutil
+
+from tpfand import build, control, settings, devices, modelinfo
+
+# sensors of the default model: id -> (coupling to the heat source, offset in K)
+DEFAULT_SENSORS = {0: (1.0, 0.0),   # CPU
+                   1: (0.6, 2.0),   # MiniPCI
+                   2: (0.3, 3.0),   # HDD
+                   3: (0.9, 0.0),   # GPU
+                   4: (0.2, 1.0),   # battery
+                   6: (0.2, 1.0)}   # battery
+
+# default workload: (start time in s, heat input in W), repeated every period
+DEFAULT_WORKLOAD = [(0, 8.0), (300, 35.0), (480, 12.0), (900, 45.0), (960, 20.0), (1200, 8.0)]
+DEFAULT_WORKLOAD_PERIOD = 1800
+
+# model info reported by the simulated notebook
+DEFAULT_MODEL_INFO = ('LENOVO', '2007VG4', 'ThinkPad T61')
+
+# fan rpm per fan level
+RPM_PER_LEVEL = 600
+RPM_FULL_SPEED = 5500
+
+class SimulatedClock(object):
+    """simulated time with GLib style timers, time only advances when timers are dispatched"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+        self.timers = [ ]
+        self.removed = set()
+        self.next_id = 1
+
+    def time(self):
+        return self.now
+
+    def timeout_add(self, interval, callback):
+        timer = self.next_id
+        self.next_id += 1
+        heapq.heappush(self.timers, (self.now + interval / 1000.0, timer, interval, callback))
+        return timer
+
+    def source_remove(self, timer):
+        self.removed.add(timer)
+
+    def next_due(self):
+        """returns the time of the next pending timer or None"""
+        while self.timers and self.timers[0][1] in self.removed:
+            self.removed.discard(heapq.heappop(self.timers)[1])
+        if not self.timers:
+            return None
+        return self.timers[0][0]
+
+    def next_callback(self):
+        """returns the callback of the next pending timer or None"""
+        if self.next_due() is None:
+            return None
+        return self.timers[0][3]
+
+    def dispatch(self):
+        """advances the time to the next pending timer and runs it"""
+        if self.next_due() is None:
+            return
+        due, timer, interval, callback = heapq.heappop(self.timers)
+        self.now = max(self.now, due)
+        if callback():
+            # returning True keeps a GLib timer running
+            heapq.heappush(self.timers, (self.now + interval / 1000.0, timer, interval, callback))
+
+class Workload(object):
+    """heat input over time, given as steps of (start time in s, power in W)"""
+
+    def __init__(self, steps=DEFAULT_WORKLOAD, period=DEFAULT_WORKLOAD_PERIOD):
+        self.steps = sorted(steps)
+        self.period = period
+
+    def power(self, t):
+        """returns the heat input in W at time t"""
+        if self.period:
+            t = t % self.period
+        power = self.steps[0][1]
+        for start, step_power in self.steps:
+            if start > t:
+                break
+            power = step_power
+        return power
+
+    @staticmethod
+    def from_file(path, period=None):
+        """reads a workload trace with one 'seconds watts' pair per line"""
+        steps = [ ]
+        trace = open(path, 'r')
+        try:
+            for line in trace:
+                line = line.split('#')[0].strip()
+                if len(line) > 0:
+                    start, power = line.split()
+                    steps.append((float(start), float(power)))
+        finally:
+            trace.close()
+        return Workload(steps, period)
+
+class ThermalModel(object):
+    """lumped thermal model: one heat capacity heated by the workload and cooled
+       proportionally to the fan level, every sensor sees a fraction of its temperature"""
+
+    def __init__(self, ambient=25.0, capacity=60.0, passive_conductance=0.4,
+                 fan_conductance=1.6, sensors=DEFAULT_SENSORS, auto_level=4):
+        self.ambient = ambient
+        # heat capacity in J/K
+        self.capacity = capacity
+        # heat flow to the ambient in W/K with the fan off and the extra flow at level 7
+        self.passive_conductance = passive_conductance
+        self.fan_conductance = fan_conductance
+        self.sensors = sensors
+        # level the embedded controller chooses in auto mode
+        self.auto_level = auto_level
+        self.temperature = ambient
+
+    def fan_level(self, speed):
+        """returns the effective fan level (0-7, above 7 for full-speed) for a fan speed"""
+        if speed == devices.SPEED_AUTO:
+            return self.auto_level
+        if speed in (devices.SPEED_FULL, devices.SPEED_DISENGAGED):
+            return 8.5
+        return max(speed - 1, 0)
+
+    def step(self, power, speed, dt):
+        """advances the model by dt seconds"""
+        conductance = self.passive_conductance + self.fan_conductance * self.fan_level(speed) / 7.0
+        self.temperature += dt * (power - conductance * (self.temperature - self.ambient)) / self.capacity
+
+    def read(self, count=devices.SENSOR_COUNT):
+        """returns the sensor readings, -128 for sensors that do not exist"""
+        temps = [ ]
+        for id in range(0, count):
+            if id in self.sensors:
+                coupling, offset = self.sensors[id]
+                temps.append(int(round(self.ambient + offset + coupling * (self.temperature - self.ambient))))
+            else:
+                temps.append(-128)
+        return temps
+
+class SimulatedFanDevice(devices.FanDevice):
+    """in-memory fan that falls back to auto mode when the watchdog expires"""
+
+    name = 'simulated'
+
+    def __init__(self, clock, model):
+        devices.FanDevice.__init__(self)
+        self.clock = clock
+        self.model = model
+        self.speed = devices.SPEED_AUTO
+        self.watchdog = 0
+        self.watchdog_reset = 0.0
+        self.watchdog_expired = False
+        self.watchdog_expiries = 0
+
+    def update(self):
+        """lets the embedded controller take over if the watchdog expired"""
+        if self.watchdog > 0 and not self.watchdog_expired and \
+                self.clock.time() > self.watchdog_reset + self.watchdog:
+            self.speed = devices.SPEED_AUTO
+            self.watchdog_expired = True
+            self.watchdog_expiries += 1
+
+    def get_speed(self):
+        """returns the speed the fan is actually running at"""
+        self.update()
+        return self.speed
+
+    def is_available(self):
+        return True
+
+    def read_hw_state(self):
+        speed = devices.observed_speed(self.get_speed())
+        if speed == devices.SPEED_FULL:
+            rpm = RPM_FULL_SPEED
+        else:
+            rpm = int(self.model.fan_level(speed) * RPM_PER_LEVEL)
+        return {'level': speed,
+                'rpm': rpm }
+
+    def write_speed(self, speed):
+        self.update()
+        self.speed = speed
+        self.watchdog_reset = self.clock.time()
+        self.watchdog_expired = False
+
+    def write_watchdog(self, watchdog):
+        self.update()
+        self.watchdog = watchdog
+        self.watchdog_reset = self.clock.time()
+        self.watchdog_expired = False
+
+class SimulatedThermalDevice(devices.ThermalDevice):
+    """temperatures read from the thermal model"""
+
+    name = 'simulated'
+
+    def __init__(self, model):
+        devices.ThermalDevice.__init__(self)
+        self.model = model
+        self.reads = 0
+
+    def is_available(self):
+        return True
+
+    def read_temperatures(self):
+        self.reads += 1
+        return self.model.read()
+
+class ReplayThermalDevice(devices.ThermalDevice):
+    """temperatures replayed from a recorded trace, one list of readings per poll"""
+
+    name = 'replay'
+
+    def __init__(self, samples):
+        devices.ThermalDevice.__init__(self)
+        self.samples = samples
+        self.reads = 0
+
+    def is_available(self):
+        return len(self.samples) > 0
+
+    def read_temperatures(self):
+        temps = list(self.samples[self.reads % len(self.samples)])
+        self.reads += 1
+        return temps
+
+    @staticmethod
+    def from_file(path):
+        """reads a trace in the csv format written by main(), a time column,
+           one column per sensor and an optional speed column"""
+        samples = [ ]
+        trace = open(path, 'r')
+        try:
+            for line in trace:
+                fields = line.strip().split(',')
+                if len(fields) < 2 or not fields[1].lstrip('-').isdigit():
+                    # header or empty line
+                    continue
+                samples.append(map(int, fields[1:devices.SENSOR_COUNT + 1]))
+        finally:
+            trace.close()
+        return ReplayThermalDevice(samples)
+
+class Simulation(object):
+    """runs the fan controller against the thermal model in simulated time"""
+
+    def __init__(self, model=None, workload=None, profile=None, trigger_points=None,
+                 hysteresis=2, data_dir=build.data_dir, model_info=None, step=0.1, thermal=None,
+                 thermal_file=False):
+        self.model = model or ThermalModel()
+        self.workload = workload or Workload()
+        # integration step of the thermal model in s
+        self.step = step
+        self.clock = SimulatedClock()
+        self.fan = SimulatedFanDevice(self.clock, self.model)
+        # (time, temperatures, fan speed) after every timer
+        self.samples = [ ]
+
+        # the config file lives in a scratch directory, the real one is never touched
+        self.config_dir = tempfile.mkdtemp(prefix='tpfand-sim-')
+        # with thermal_file the temperatures are read through the procfs backend from
+        # a file the model writes, so the file system calls of a poll are real
+        self.thermal_path = None
+        if thermal is None and thermal_file:
+            self.thermal_path = os.path.join(self.config_dir, 'thermal')
+            self.write_thermal_file()
+            thermal = devices.ProcThermalDevice(self.thermal_path)
+        self.thermal = thermal or SimulatedThermalDevice(self.model)
+        self.settings = settings.Settings(None, None,
+                                          model_info=model_info or modelinfo.StaticModelInfo(*DEFAULT_MODEL_INFO),
+                                          config_path=os.path.join(self.config_dir, 'tpfand.conf'),
+                                          data_dir=data_dir)
+        if profile is not None:
+            self.settings.read_config(profile, False)
+        if trigger_points is not None:
+            self.settings.override_profile = True
+            self.settings.trigger_points = dict(trigger_points)
+            self.settings.hysteresis = hysteresis
+        self.settings.enabled = True
+        self.settings.verify()
+
+        control.act_settings = self.settings
+        self.controller = control.Control(None, None, fan=self.fan, thermal=self.thermal,
+                                          clock=self.clock)
+
+    def close(self):
+        """removes the scratch directory"""
+        self.thermal.close()
+        shutil.rmtree(self.config_dir, True)
+
+    def write_thermal_file(self):
+        """writes the sensor readings in the format of /proc/acpi/ibm/thermal"""
+        thermal_file = open(self.thermal_path, 'w')
+        try:
+            thermal_file.write('temperatures:\t' + ' '.join(map(str, self.model.read())) + '\n')
+        finally:
+            thermal_file.close()
+
+    def advance(self, until):
+        """integrates the thermal model up to the given time"""
+        t = self.clock.now
+        while t < until:
+            dt = min(self.step, until - t)
+            self.model.step(self.workload.power(t), self.fan.get_speed(), dt)
+            t += dt
+            self.clock.now = t
+        self.clock.now = until
+        if self.thermal_path is not None:
+            self.write_thermal_file()
+
+    def run(self, duration):
+        """runs the controller for duration simulated seconds"""
+        end = self.clock.now + duration
+        while True:
+            due = self.clock.next_due()
+            if due is None or due > end:
+                break
+            self.advance(due)
+            self.clock.dispatch()
+            self.samples.append((self.clock.now, self.model.read(), self.fan.get_speed()))
+        self.advance(end)
+        return self.samples
+
+def main():
+    """runs a simulation and prints one csv line per timer"""
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--duration', type='float', default=3600.0,
+                      help='simulated time in seconds (default: %default)')
+    parser.add_option('--workload', help="workload trace with 'seconds watts' lines")
+    parser.add_option('--profile', help='fan profile to load')
+    parser.add_option('--data-dir', default=build.data_dir,
+                      help='directory containing models/ (default: %default)')
+    options, args = parser.parse_args()
+
+    workload = None
+    if options.workload:
+        workload = Workload.from_file(options.workload)
+    simulation = Simulation(workload=workload, profile=options.profile, data_dir=options.data_dir)
+    try:
+        print 'time,' + ','.join(['temp%d' % id for id in range(0, devices.SENSOR_COUNT)]) + ',speed'
+        for t, temps, speed in simulation.run(options.duration):
+            print '%.3f,%s,%d' % (t, ','.join(map(str, temps)), speed)
+    finally:
+        simulation.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, time
+
+def get_process_start_time():
+    """returns the time the process was started, from /proc, or None"""
+    try:
+        stat_file = open('/proc/self/stat', 'r')
+        try:
+            # the command name may contain spaces, the fields after it don't
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        finally:
+            stat_file.close()
+        boot_time = None
+        proc_stat = open('/proc/stat', 'r')
+        try:
+            for line in proc_stat:
+                if line.startswith('btime '):
+                    boot_time = int(line.split()[1])
+        finally:
+            proc_stat.close()
+        if boot_time is None:
+            return None
+        # field 22 of the stat line is the start time in clock ticks after boot
+        return boot_time + float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+class StartupTimer(object):
+    """records how long the phases of the daemon start take"""
+
+    def __init__(self):
+        now = time.time()
+        self.start = now
+        self.last = now
+        self.phases = [ ]
+        self.finished = False
+        # the interpreter start up until this module is imported; the start
+        # time in /proc only has a resolution of one clock tick
+        started = get_process_start_time()
+        if started is not None and started < now:
+            self.start = started
+            self.phases.append(('interpreter', now - started))
+
+    def mark(self, phase):
+        """ends phase, it started at the end of the previous phase"""
+        if self.finished:
+            return
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def finish(self):
+        """stops recording, later phases are not part of the start up"""
+        self.finished = True
+
+    def get_phases(self):
+        """returns [(phase, seconds), ...] in the order the phases ran"""
+        return list(self.phases)
+
+    def get_total(self):
+        """returns the seconds from the process start to the last phase"""
+        return self.last - self.start
+
+    def format(self):
+        """returns the phases as printable lines"""
+        lines = ['Startup times:']
+        for phase, seconds in self.phases:
+            lines.append('  %-16s %8.1f ms' % (phase, seconds * 1000.0))
+        lines.append('  %-16s %8.1f ms' % ('total', self.get_total() * 1000.0))
+        return '\n'.join(lines)
+
+# timer of this process, the phases are marked by the daemon
+timer = StartupTimer()
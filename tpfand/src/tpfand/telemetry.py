@@ -0,0 +1,221 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import os, os.path, glob, struct, mmap
+
+from tpfand import build, devices
+
+# segment header: magic, format version, record size
+HEADER = struct.Struct('<4sHH')
+MAGIC = 'TPFT'
+VERSION = 1
+
+# record: timestamp, one signed byte per sensor, fan level, fan rpm
+RECORD = struct.Struct('<d%dbHH' % devices.SENSOR_COUNT)
+
+# records per segment and number of segments kept, about 28 MB in total
+SEGMENT_RECORDS = 32768
+SEGMENT_COUNT = 32
+
+SEGMENT_PATTERN = 'telemetry-*.bin'
+
+class TelemetryLog(object):
+    """appends poll results as fixed size records to rotating segment files"""
+
+    def __init__(self, directory=build.telemetry_dir, segment_records=SEGMENT_RECORDS,
+                 segment_count=SEGMENT_COUNT):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.segment_count = segment_count
+        self.fd = None
+        self.records = 0
+        self.last_timestamp = None
+
+    def close(self):
+        """closes the current segment"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def append(self, timestamp, temps, level, rpm):
+        """writes one record, starts a new segment when the current one is full
+           or the clock went backwards"""
+        if self.fd is None or self.records >= self.segment_records or \
+                (self.last_timestamp is not None and timestamp < self.last_timestamp):
+            self.rotate(timestamp)
+        values = [timestamp]
+        for n in xrange(0, devices.SENSOR_COUNT):
+            temp = temps[n] if n < len(temps) else -128
+            values.append(min(max(temp, -128), 127))
+        values.append(min(max(level, 0), 0xffff))
+        values.append(min(max(rpm, 0), 0xffff))
+        os.write(self.fd, RECORD.pack(*values))
+        self.records += 1
+        self.last_timestamp = timestamp
+
+    def rotate(self, timestamp):
+        """starts a new segment and removes the oldest ones"""
+        self.close()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, 'telemetry-%016.6f.bin' % timestamp)
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0644)
+        if os.fstat(self.fd).st_size == 0:
+            os.write(self.fd, HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.records = 0
+        self.last_timestamp = None
+        segments = list_segments(self.directory)
+        for old in segments[:max(len(segments) - self.segment_count, 0)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+class Segment(object):
+    """memory mapped, read only segment file"""
+
+    def __init__(self, path):
+        self.path = path
+        segment_file = open(path, 'rb')
+        try:
+            size = os.fstat(segment_file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError('truncated segment ' + path)
+            self.map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            segment_file.close()
+        magic, version, record_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.map.close()
+            raise ValueError('unknown segment format ' + path)
+        # ignore a partially written last record
+        self.count = (size - HEADER.size) / RECORD.size
+
+    def close(self):
+        self.map.close()
+
+    def timestamp(self, n):
+        """returns the timestamp of record n"""
+        return struct.unpack_from('<d', self.map, HEADER.size + n * RECORD.size)[0]
+
+    def record(self, n):
+        """returns record n as (timestamp, temperatures, level, rpm)"""
+        values = RECORD.unpack_from(self.map, HEADER.size + n * RECORD.size)
+        return values[0], list(values[1:-2]), values[-2], values[-1]
+
+    def find(self, timestamp):
+        """returns the index of the first record not older than timestamp"""
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.timestamp(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+class TelemetryReader(object):
+    """range queries over the telemetry segments"""
+
+    def __init__(self, directory=build.telemetry_dir):
+        self.segments = [ ]
+        for path in list_segments(directory):
+            try:
+                self.segments.append(Segment(path))
+            except (ValueError, IOError, mmap.error), ex:
+                print >>sys.stderr, 'Skipping %s: %s' % (path, ex)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = [ ]
+
+    def ranges(self, start=None, end=None):
+        """yields (segment, first, last) for all records with start <= timestamp < end"""
+        for segment in self.segments:
+            if segment.count == 0:
+                continue
+            first = 0 if start is None else segment.find(start)
+            last = segment.count if end is None else segment.find(end)
+            if first < last:
+                yield segment, first, last
+
+    def query(self, start=None, end=None):
+        """yields (timestamp, temperatures, level, rpm) for all records in the range"""
+        for segment, first, last in self.ranges(start, end):
+            for n in xrange(first, last):
+                yield segment.record(n)
+
+    def to_numpy(self, start=None, end=None):
+        """returns the records in the range as a NumPy structured array,
+           the data of every segment is viewed without copying before concatenation"""
+        import numpy
+        dtype = numpy.dtype([('timestamp', '<f8'), ('temps', 'i1', (devices.SENSOR_COUNT,)),
+                             ('level', '<u2'), ('rpm', '<u2')])
+        parts = [numpy.frombuffer(segment.map, dtype=dtype, count=last - first,
+                                  offset=HEADER.size + first * RECORD.size)
+                 for segment, first, last in self.ranges(start, end)]
+        if not parts:
+            return numpy.zeros(0, dtype=dtype)
+        if len(parts) == 1:
+            # a view of the mapped segment, valid until the reader is closed
+            return parts[0]
+        return numpy.concatenate(parts)
+
+    def export_csv(self, output, start=None, end=None):
+        """writes the records in the range as csv"""
+        output.write('time,' + ','.join(['temp%d' % n for n in range(0, devices.SENSOR_COUNT)]) +
+                     ',level,rpm\n')
+        for timestamp, temps, level, rpm in self.query(start, end):
+            output.write('%.3f,%s,%d,%d\n' % (timestamp, ','.join(map(str, temps)), level, rpm))
+
+def list_segments(directory):
+    """returns the segment files in directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN)))
+
+def main():
+    """exports the telemetry log"""
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--directory', default=build.telemetry_dir,
+                      help='directory containing the segments (default: %default)')
+    parser.add_option('--start', type='float', help='first timestamp to export')
+    parser.add_option('--end', type='float', help='export records older than this timestamp')
+    parser.add_option('--npy', help='save the records as NumPy array to this file instead of printing csv')
+    options, args = parser.parse_args()
+
+    reader = TelemetryReader(options.directory)
+    try:
+        if options.npy:
+            import numpy
+            numpy.save(options.npy, reader.to_numpy(options.start, options.end))
+        else:
+            reader.export_csv(sys.stdout, options.start, options.end)
+    finally:
+        reader.close()
+
+if __name__ == '__main__':
+    main()
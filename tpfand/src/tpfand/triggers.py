@@ -0,0 +1,207 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+# temperature range covered by the compiled tables, readings outside
+# of it are clamped to the nearest table entry
+TEMP_MIN = -128
+TEMP_MAX = 255
+TABLE_SIZE = TEMP_MAX - TEMP_MIN + 1
+
+def is_connected(temp):
+    """returns False if the reading belongs to a disconnected sensor (+/-128 or 0)"""
+    return temp != 0 and temp != 128 and temp != -128
+
+def table_index(temp):
+    """returns the table index for the given temperature"""
+    idx = temp - TEMP_MIN
+    if idx < 0:
+        return 0
+    if idx >= TABLE_SIZE:
+        return TABLE_SIZE - 1
+    return idx
+
+def compile_trigger_points(points, hysteresis):
+    """compiles the trigger points {temp: level} of one sensor into dense tables indexed
+       by temperature: the required fan level, the hysteresis trip temperature and the
+       temperature of the next trigger point that raises the level.
+       The trip temperature belongs to the lowest trigger point that demands the level."""
+    levels = [0] * TABLE_SIZE
+    trips = [None] * TABLE_SIZE
+    sorted_points = sorted(points.items())
+    level = 0
+    trip = None
+    n = 0
+    for idx in xrange(0, TABLE_SIZE):
+        temp = idx + TEMP_MIN
+        while n < len(sorted_points) and sorted_points[n][0] <= temp:
+            trigger_temp, trigger_level = sorted_points[n]
+            if trigger_level > level:
+                level = trigger_level
+                trip = trigger_temp - hysteresis
+            n += 1
+        levels[idx] = level
+        trips[idx] = trip
+    # levels never decrease with the temperature, so the next rise is the next step
+    rises = [None] * TABLE_SIZE
+    for idx in xrange(TABLE_SIZE - 2, -1, -1):
+        if levels[idx + 1] > levels[idx]:
+            rises[idx] = idx + 1 + TEMP_MIN
+        else:
+            rises[idx] = rises[idx + 1]
+    return levels, trips, rises
+
+class TriggerTables(object):
+    """trigger points and hysteresis of all sensors compiled into lookup tables"""
+
+    def __init__(self, trigger_points, hysteresis, sensor_count, previous=None):
+        """compiles the tables, the tables of sensors whose trigger points and
+           hysteresis are the same as in previous are shared with it"""
+        self.hysteresis = hysteresis
+        self.points = [ ]
+        self.levels = [ ]
+        self.trips = [ ]
+        self.rises = [ ]
+        for id in range(0, sensor_count):
+            points = dict(trigger_points.get(id, { }))
+            if previous is not None and previous.hysteresis == hysteresis and \
+                    id < previous.get_sensor_count() and previous.points[id] == points:
+                levels, trips, rises = previous.levels[id], previous.trips[id], previous.rises[id]
+            else:
+                levels, trips, rises = compile_trigger_points(points, hysteresis)
+            self.points.append(points)
+            self.levels.append(levels)
+            self.trips.append(trips)
+            self.rises.append(rises)
+        # sensors that can demand a fan level, the others need not be evaluated
+        self.active = [id for id in range(0, sensor_count) if max(self.levels[id]) > 0]
+
+    def get_sensor_count(self):
+        """returns the number of compiled sensors"""
+        return len(self.levels)
+
+    def get_changed_sensors(self, previous):
+        """returns the ids of the sensors whose tables are not shared with previous"""
+        return [id for id in range(0, self.get_sensor_count())
+                if id >= previous.get_sensor_count() or self.levels[id] is not previous.levels[id]]
+
+    def lookup(self, id, temp):
+        """returns (level, trip temperature) for the given sensor and temperature"""
+        idx = table_index(temp)
+        return self.levels[id][idx], self.trips[id][idx]
+
+    def next_trigger(self, id, temp):
+        """returns the temperature at which the level of the given sensor rises next, or None"""
+        return self.rises[id][table_index(temp)]
+
+class TriggerEngine(object):
+    """decides the fan level from compiled trigger tables and keeps the hysteresis state"""
+
+    def __init__(self, tables=None):
+        self.tables = None
+        # hysteresis state per sensor, None if the sensor has not tripped
+        self.trip_temps = [ ]
+        self.trip_speeds = [ ]
+        # input and result of the last evaluation
+        self.last_temps = None
+        self.last_speed = 0
+        if tables is not None:
+            self.set_tables(tables)
+
+    def set_tables(self, tables):
+        """uses new compiled tables, keeps the hysteresis state of the sensors
+           whose trigger points did not change"""
+        if tables is self.tables:
+            return
+        count = tables.get_sensor_count()
+        self.trip_temps = (self.trip_temps + [None] * count)[:count]
+        self.trip_speeds = (self.trip_speeds + [None] * count)[:count]
+        if self.tables is not None:
+            for id in tables.get_changed_sensors(self.tables):
+                self.trip_temps[id] = None
+                self.trip_speeds[id] = None
+        self.tables = tables
+        self.last_temps = None
+
+    def reset(self):
+        """resets the hysteresis state"""
+        count = self.tables.get_sensor_count() if self.tables is not None else 0
+        self.trip_temps = [None] * count
+        self.trip_speeds = [None] * count
+        self.last_temps = None
+
+    def get_trip_temperatures(self):
+        """returns {sensor id: hysteresis temperature} for all tripped sensors"""
+        return dict((id, temp) for id, temp in enumerate(self.trip_temps) if temp is not None)
+
+    def get_trip_speeds(self):
+        """returns {sensor id: hysteresis fan speed} for all tripped sensors"""
+        return dict((id, speed) for id, speed in enumerate(self.trip_speeds) if speed is not None)
+
+    def decide(self, temps):
+        """returns the fan speed required by the given sensor readings,
+           temps is kept for the next call and must not be modified afterwards"""
+        # nothing can change if the readings are the same as last time
+        if temps == self.last_temps:
+            return self.last_speed
+
+        levels = self.tables.levels
+        trips = self.tables.trips
+        trip_temps = self.trip_temps
+        trip_speeds = self.trip_speeds
+        new_speed = 0
+        count = len(temps)
+        for id in self.tables.active:
+            if id >= count:
+                break
+            temp = temps[id]
+            # value is +/-128 or 0, if sensor is disconnected
+            if temp == 0 or temp == 128 or temp == -128:
+                continue
+            speed = 0
+            # check if temperature is above hysteresis shutdown point
+            trip = trip_temps[id]
+            if trip is not None:
+                if temp >= trip:
+                    speed = trip_speeds[id]
+                else:
+                    trip_temps[id] = None
+                    trip_speeds[id] = None
+            # check if temperature is over trigger point
+            idx = temp - TEMP_MIN
+            if idx < 0:
+                idx = 0
+            elif idx >= TABLE_SIZE:
+                idx = TABLE_SIZE - 1
+            level = levels[id][idx]
+            if level > speed:
+                trip_temps[id] = trips[id][idx]
+                trip_speeds[id] = level
+                speed = level
+            if speed > new_speed:
+                new_speed = speed
+
+        self.last_temps = temps
+        self.last_speed = new_speed
+        return new_speed
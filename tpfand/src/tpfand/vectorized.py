@@ -0,0 +1,181 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from tpfand import triggers
+
+def is_available():
+    """returns True if NumPy is installed"""
+    return numpy is not None
+
+class NumpyTriggerEngine(object):
+    """decides the fan level for all sensors in one vectorized pass,
+       gives the same results as triggers.TriggerEngine"""
+
+    def __init__(self, tables=None):
+        if numpy is None:
+            raise ImportError('NumPy is required for the vectorized engine')
+        self.tables = None
+        self.levels = None
+        self.trips = None
+        self.rows = None
+        # hysteresis state, trip_temps / trip_speeds are only valid where has_trip is set
+        self.has_trip = numpy.zeros(0, dtype=bool)
+        self.trip_temps = numpy.zeros(0, dtype=numpy.int32)
+        self.trip_speeds = numpy.zeros(0, dtype=numpy.int32)
+        # input and result of the last evaluation
+        self.last_temps = None
+        self.last_speed = 0
+        if tables is not None:
+            self.set_tables(tables)
+
+    def set_tables(self, tables):
+        """uses new compiled tables, keeps the hysteresis state of the sensors
+           whose trigger points did not change"""
+        if tables is self.tables:
+            return
+        previous = self.tables
+        self.tables = tables
+        count = tables.get_sensor_count()
+        self.levels = numpy.array(tables.levels, dtype=numpy.int32).reshape(count, triggers.TABLE_SIZE)
+        self.trips = numpy.array([[trip or 0 for trip in trips] for trips in tables.trips],
+                                 dtype=numpy.int32).reshape(count, triggers.TABLE_SIZE)
+        self.rows = numpy.arange(count)
+        self.has_trip = self.resize(self.has_trip, count)
+        self.trip_temps = self.resize(self.trip_temps, count)
+        self.trip_speeds = self.resize(self.trip_speeds, count)
+        if previous is not None:
+            self.has_trip[tables.get_changed_sensors(previous)] = False
+        self.last_temps = None
+
+    def resize(self, state, count):
+        """returns state truncated or zero padded to count entries"""
+        resized = numpy.zeros(count, dtype=state.dtype)
+        n = min(count, len(state))
+        resized[:n] = state[:n]
+        return resized
+
+    def reset(self):
+        """resets the hysteresis state"""
+        self.has_trip[:] = False
+        self.last_temps = None
+
+    def get_trip_temperatures(self):
+        """returns {sensor id: hysteresis temperature} for all tripped sensors"""
+        return dict((int(id), int(self.trip_temps[id])) for id in numpy.flatnonzero(self.has_trip))
+
+    def get_trip_speeds(self):
+        """returns {sensor id: hysteresis fan speed} for all tripped sensors"""
+        return dict((int(id), int(self.trip_speeds[id])) for id in numpy.flatnonzero(self.has_trip))
+
+    def decide(self, temps):
+        """returns the fan speed required by the given sensor readings,
+           temps is kept for the next call and must not be modified afterwards"""
+        if temps == self.last_temps:
+            return self.last_speed
+        count = min(len(temps), len(self.rows))
+        speed = self.step(numpy.asarray(temps[:count], dtype=numpy.int32), count)
+        self.last_temps = temps
+        self.last_speed = speed
+        return speed
+
+    def step(self, temps, count):
+        """updates the hysteresis state of the first count sensors, returns the new fan speed"""
+        has_trip = self.has_trip[:count]
+        trip_temps = self.trip_temps[:count]
+        trip_speeds = self.trip_speeds[:count]
+        # value is +/-128 or 0, if sensor is disconnected
+        valid = (temps != 0) & (temps != 128) & (temps != -128)
+        # check if temperature is above hysteresis shutdown point
+        held = has_trip & valid & (temps >= trip_temps)
+        has_trip &= held | ~valid
+        speed = numpy.where(held, trip_speeds, 0)
+        # check if temperature is over trigger point
+        idx = numpy.clip(temps - triggers.TEMP_MIN, 0, triggers.TABLE_SIZE - 1)
+        rows = self.rows[:count]
+        level = self.levels[rows, idx]
+        tripped = valid & (level > speed)
+        trip_temps[tripped] = self.trips[rows, idx][tripped]
+        trip_speeds[tripped] = level[tripped]
+        has_trip |= tripped
+        if count == 0:
+            return 0
+        return int(numpy.where(tripped, level, speed).max())
+
+    def evaluate_trace(self, samples):
+        """runs the engine over a (samples x sensors) array of recorded readings,
+           returns the fan speed decided for every sample"""
+        samples = numpy.asarray(samples, dtype=numpy.int32)
+        count = min(samples.shape[1], len(self.rows))
+        speeds = numpy.zeros(samples.shape[0], dtype=numpy.int32)
+        temps = samples[:, :count]
+        # the table lookups of all samples in one pass, only the hysteresis is sequential
+        idx = numpy.clip(temps - triggers.TEMP_MIN, 0, triggers.TABLE_SIZE - 1)
+        rows = self.rows[:count]
+        levels = self.levels[rows, idx]
+        trips = self.trips[rows, idx]
+        valid = (temps != 0) & (temps != 128) & (temps != -128)
+        levels[~valid] = 0
+        for id in xrange(0, count):
+            # a sensor that never demands a level and holds none can't raise the speed
+            if self.has_trip[id] or levels[:, id].any():
+                sensor_speeds = self.trace_sensor(id, temps[:, id].tolist(), valid[:, id].tolist(),
+                                                  levels[:, id].tolist(), trips[:, id].tolist())
+                numpy.maximum(speeds, sensor_speeds, speeds)
+        self.last_temps = None
+        return speeds
+
+    def trace_sensor(self, id, temps, valid, levels, trips):
+        """runs the hysteresis of one sensor over its readings and table lookups,
+           returns the fan speed the sensor demands for every sample"""
+        has_trip = bool(self.has_trip[id])
+        trip_temp = int(self.trip_temps[id])
+        trip_speed = int(self.trip_speeds[id])
+        speeds = [ ]
+        append = speeds.append
+        for temp, is_valid, level, trip in zip(temps, valid, levels, trips):
+            speed = 0
+            if is_valid:
+                if has_trip:
+                    # check if temperature is above hysteresis shutdown point
+                    if temp >= trip_temp:
+                        speed = trip_speed
+                    else:
+                        has_trip = False
+                # check if temperature is over trigger point
+                if level > speed:
+                    has_trip = True
+                    trip_temp = trip
+                    trip_speed = level
+                    speed = level
+            append(speed)
+        self.has_trip[id] = has_trip
+        self.trip_temps[id] = trip_temp
+        self.trip_speeds[id] = trip_speed
+        return speeds
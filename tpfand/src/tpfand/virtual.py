@@ -0,0 +1,190 @@
+#! /usr/bin/python2.7
+# -*- coding: utf8 -*-
+#
+# tpfanco - controls the fan-speed of IBM/Lenovo ThinkPad Notebooks
+# Copyright (C) 2011-2012 Vladyslav Shtabovenko
+# Copyright (C) 2007-2009 Sebastian Urban
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+if not ('/usr/share/pyshared' in sys.path):
+    sys.path.append('/usr/share/pyshared')
+
+import math
+
+from tpfand import devices, triggers
+
+# physical and virtual sensors together, virtual sensor ids start at devices.SENSOR_COUNT
+MAX_SENSORS = 32
+
+# reading of a virtual sensor without connected inputs
+DISCONNECTED = -128
+
+# range of the computed readings, keeps them clear of the +/-128 sentinels
+READING_MIN = -127
+READING_MAX = 127
+
+FUNCTIONS = ('max', 'mean', 'wsum', 'ewma')
+
+def parse_expression(text):
+    """parses 'function(arg, ...)' into (function, sensor ids, parameters):
+       max(id, ...) and mean(id, ...) of the given or of all physical sensors,
+       wsum(id*weight, ...) and ewma(id, time constant in seconds)"""
+    text = text.strip()
+    open_pos = text.find('(')
+    if open_pos < 0 or not text.endswith(')'):
+        raise ValueError('invalid expression: ' + text)
+    function = text[:open_pos].strip()
+    if function not in FUNCTIONS:
+        raise ValueError('unknown function: ' + function)
+    args = [arg.strip() for arg in text[open_pos + 1:-1].split(',') if arg.strip()]
+    try:
+        if function == 'ewma':
+            if len(args) != 2 or float(args[1]) <= 0:
+                raise ValueError()
+            return (function, (int(args[0]),), (float(args[1]),))
+        ids = [ ]
+        weights = [ ]
+        for arg in args:
+            fields = arg.split('*')
+            if len(fields) > 2 or (len(fields) == 2 and function != 'wsum'):
+                raise ValueError()
+            ids.append(int(fields[0]))
+            weights.append(float(fields[1]) if len(fields) == 2 else 1.0)
+        if function == 'wsum':
+            if not ids:
+                raise ValueError()
+            return (function, tuple(ids), tuple(weights))
+        return (function, tuple(ids), ())
+    except ValueError:
+        raise ValueError('invalid arguments: ' + text)
+
+def format_expression(expression):
+    """returns the profile syntax of an expression"""
+    function, ids, params = expression
+    if function == 'ewma':
+        args = ['%d' % ids[0], '%g' % params[0]]
+    elif function == 'wsum':
+        args = ['%d*%g' % (id, weight) for id, weight in zip(ids, params)]
+    else:
+        args = ['%d' % id for id in ids]
+    return '%s(%s)' % (function, ', '.join(args))
+
+def check_expression(id, expression, physical_count=devices.SENSOR_COUNT):
+    """raises ValueError unless expression may define virtual sensor id,
+       inputs must be physical sensors or virtual sensors with a lower id"""
+    if id < physical_count or id >= MAX_SENSORS:
+        raise ValueError('virtual sensor ids must be between %d and %d' % (physical_count, MAX_SENSORS - 1))
+    for input in expression[1]:
+        if input < 0 or input >= id:
+            raise ValueError('invalid input of virtual sensor %d: %d' % (id, input))
+
+def get_sensor_count(expressions, physical_count=devices.SENSOR_COUNT):
+    """returns the number of physical and virtual sensor ids"""
+    if not expressions:
+        return physical_count
+    return max(physical_count, max(expressions.keys()) + 1)
+
+def get_inputs(expressions, physical_count=devices.SENSOR_COUNT):
+    """returns the ids of the physical sensors read by the virtual sensors"""
+    inputs = set()
+    for function, ids, params in expressions.values():
+        if not ids and function in ('max', 'mean'):
+            ids = range(0, physical_count)
+        inputs.update([id for id in ids if id < physical_count])
+    return inputs
+
+def to_reading(value):
+    """returns a computed value as a connected reading, clamped to READING_MIN..READING_MAX,
+       0 is a disconnected sensor and is moved by 1 K in the direction of the value"""
+    reading = min(max(int(round(value)), READING_MIN), READING_MAX)
+    if reading == 0:
+        if value < 0:
+            return -1
+        return 1
+    return reading
+
+class VirtualSensorPlan(object):
+    """virtual sensors compiled into steps that are evaluated in one pass
+       over the readings of the physical sensors"""
+
+    def __init__(self, expressions, physical_count=devices.SENSOR_COUNT, previous=None):
+        """compiles the expressions {id: expression}, the filter state of ewma sensors
+           whose expression is the same as in previous is kept"""
+        self.expressions = dict(expressions)
+        self.physical_count = physical_count
+        self.count = get_sensor_count(expressions, physical_count)
+        # (id, function, input ids, parameters) in id order, so inputs come first
+        self.steps = [ ]
+        for id in sorted(self.expressions.keys()):
+            function, ids, params = self.expressions[id]
+            if not ids and function in ('max', 'mean'):
+                ids = tuple(range(0, physical_count))
+            self.steps.append((id, function, ids, params))
+        # ewma sensor id -> (filtered value, time of the last reading)
+        self.ewma_state = { }
+        if previous is not None:
+            for id, state in previous.ewma_state.items():
+                if previous.expressions.get(id) == self.expressions.get(id):
+                    self.ewma_state[id] = state
+
+    def get_sensor_count(self):
+        """returns the number of physical and virtual sensor ids"""
+        return self.count
+
+    def evaluate(self, temps, now):
+        """returns the physical readings followed by the virtual sensors, disconnected
+           inputs are skipped and a sensor without connected inputs is disconnected,
+           now is the time of the readings in seconds"""
+        if not self.steps:
+            return temps
+        values = list(temps[:self.physical_count])
+        values.extend([DISCONNECTED] * (self.count - len(values)))
+        for id, function, ids, params in self.steps:
+            if function == 'ewma':
+                value = self.filter(id, values[ids[0]], params[0], now)
+            else:
+                inputs = [n for n in xrange(0, len(ids)) if triggers.is_connected(values[ids[n]])]
+                if not inputs:
+                    continue
+                if function == 'max':
+                    value = max([values[ids[n]] for n in inputs])
+                elif function == 'mean':
+                    value = float(sum([values[ids[n]] for n in inputs])) / len(inputs)
+                else:
+                    # scaled up to the full weight if an input is disconnected
+                    # and the weights of the connected ones do not cancel out
+                    value = sum([values[ids[n]] * params[n] for n in inputs])
+                    weight = sum([params[n] for n in inputs])
+                    if len(inputs) < len(ids) and weight != 0:
+                        value = value * sum(params) / weight
+            if value is not None:
+                values[id] = to_reading(value)
+        return values
+
+    def filter(self, id, temp, time_constant, now):
+        """returns the exponentially smoothed reading of an ewma sensor or None"""
+        if not triggers.is_connected(temp):
+            self.ewma_state.pop(id, None)
+            return None
+        state = self.ewma_state.get(id)
+        if state is None or now < state[1]:
+            value = float(temp)
+        else:
+            alpha = 1.0 - math.exp(-(now - state[1]) / time_constant)
+            value = state[0] + alpha * (temp - state[0])
+        self.ewma_state[id] = (value, now)
+        return value